@@ -1,24 +1,232 @@
+import gc
 import json
+import os
+import re
 import sys
+import time
+from contextlib import ExitStack, contextmanager, nullcontext, redirect_stdout
 from pathlib import Path
-from argparse import ArgumentParser
+
+# Modules needed only by optional features (HTML tables, compression, the
+# work queue, --dedup, the search index, `jmd diff` and command-line options)
+# are imported where they are used, so a plain conversion only pays the
+# startup cost of the modules above. tests/test_startup.py checks this.
+
+
+# MIME types of rich outputs that jmd renders; all other payloads (images,
+# widgets, ...) are dropped while the notebook is parsed.
+RENDERED_MIME_TYPES = ("text/plain", "text/html")
+
+# Default caps for HTML tables (e.g. pandas DataFrames) rendered as Markdown
+MAX_TABLE_ROWS = 50
+MAX_TABLE_COLS = 20
+# Largest rowspan/colspan honoured, as in the HTML standard
+MAX_ROWSPAN = 65534
+MAX_COLSPAN = 1000
+
+
+def join_source(source):
+    """Joins a multiline notebook string, stored either as a list of lines or a str."""
+    if isinstance(source, str):
+        return source
+    return "".join(source)
+
+
+def source_length(source):
+    """Returns the length of a multiline notebook string without joining it."""
+    if isinstance(source, str):
+        return len(source)
+    return sum(map(len, source))
+
+
+def _digest(*parts):
+    """Returns a short, stable hex digest of the given strings."""
+    import hashlib
+
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class Output:
+    """
+    A single output of a code cell. Text payloads are kept exactly as parsed
+    (list of lines or str) and only joined when rendered.
+    """
+
+    __slots__ = ("output_type", "name", "text", "data", "traceback", "_digest")
+
+    def __init__(self, output_type, name=None, text="", data=None, traceback=()):
+        self.output_type = output_type
+        self.name = name
+        self.text = text
+        self.data = data or {}
+        self.traceback = traceback
+        self._digest = None
+
+    @classmethod
+    def from_json(cls, output):
+        """Builds an Output from its nbformat dict, keeping only rendered data."""
+        data = output.get("data")
+        if data:
+            data = {mime: data[mime] for mime in RENDERED_MIME_TYPES if mime in data}
+        return cls(
+            output.get("output_type", "unknown"),
+            output.get("name"),
+            output.get("text", ""),
+            data,
+            output.get("traceback", ()),
+        )
+
+    @property
+    def length(self):
+        """Characters of text and plain-text data, counted without joining them."""
+        return source_length(self.text) + source_length(self.data.get("text/plain", ""))
+
+    @property
+    def digest(self):
+        """Hash of the output's rendered content, computed once on first use."""
+        if self._digest is None:
+            self._digest = _digest(
+                self.output_type,
+                self.name or "",
+                join_source(self.text),
+                join_source(self.data.get("text/plain", "")),
+                join_source(self.data.get("text/html", "")),
+                "\n".join(self.traceback),
+            )
+        return self._digest
+
+
+class Cell:
+    """
+    A notebook cell. The source is kept exactly as parsed (list of lines or
+    str) and only joined when rendered.
+    """
+
+    __slots__ = (
+        "cell_type",
+        "source",
+        "execution_count",
+        "outputs",
+        "output_count",
+        "tags",
+        "_digest",
+    )
+
+    def __init__(
+        self, cell_type, source="", execution_count=None, outputs=(), tags=(), output_count=None
+    ):
+        self.cell_type = cell_type
+        self.source = source
+        self.execution_count = execution_count
+        self.outputs = outputs
+        # Outputs may be skipped while reading; the count still reflects the notebook
+        self.output_count = len(outputs) if output_count is None else output_count
+        self.tags = tags
+        self._digest = None
+
+    @classmethod
+    def from_json(cls, cell):
+        """Builds a Cell from its nbformat dict."""
+        metadata = cell.get("metadata") or {}
+        return cls(
+            cell.get("cell_type"),
+            cell.get("source", ""),
+            cell.get("execution_count"),
+            [as_output(output) for output in cell.get("outputs", ())],
+            tuple(metadata.get("tags", ())),
+        )
+
+    @property
+    def text(self):
+        """The joined cell source."""
+        return join_source(self.source)
+
+    @property
+    def length(self):
+        """Characters of the source, counted without joining it."""
+        return source_length(self.source)
+
+    @property
+    def digest(self):
+        """Hash of the cell type and source, computed once on first use."""
+        if self._digest is None:
+            self._digest = _digest(self.cell_type or "", self.text)
+        return self._digest
+
+
+def as_cell(cell):
+    """Returns `cell` as a Cell, converting a raw nbformat dict if needed."""
+    return cell if isinstance(cell, Cell) else Cell.from_json(cell)
+
+
+def as_output(output):
+    """Returns `output` as an Output, converting a raw nbformat dict if needed."""
+    return output if isinstance(output, Output) else Output.from_json(output)
+
+
+def notebook_object_hook(obj):
+    """
+    `json` object hook that builds Cell and Output objects while the notebook
+    is decoded, so the raw cell and output dicts (and unrendered payloads such
+    as images) are dropped immediately. It runs for every JSON object,
+    metadata included, but only the two key lookups below for most of them.
+    """
+    if "cell_type" in obj and "source" in obj:
+        return Cell.from_json(obj)
+    if "output_type" in obj:
+        return Output.from_json(obj)
+    return obj
+
+
+@contextmanager
+def gc_paused():
+    """
+    Pauses cyclic garbage collection. Decoded JSON cannot contain reference
+    cycles, so collections triggered while a notebook is parsed (or its
+    cells are walked) would only re-scan the large object graph, for up to
+    a third of the time spent on a large notebook.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_notebook(fp):
+    """Parses a notebook from a file object into the Cell/Output model."""
+    with gc_paused():
+        return json.load(fp, object_hook=notebook_object_hook)
+
+
+def loads_notebook(raw):
+    """Parses a notebook from a str or bytes document into the Cell/Output model."""
+    with gc_paused():
+        return json.loads(raw, object_hook=notebook_object_hook)
 
 
 def format_markdown_cell(cell, cell_num):
     """Formats a markdown cell."""
-    source = "".join(cell["source"])
+    source = as_cell(cell).text
     return f"## Cell {cell_num} (markdown)\n\n{source}\n\n---\n"
 
 
 def format_code_cell(cell, cell_num):
     """Formats a code cell's source code."""
-    source = "".join(cell["source"])
+    cell = as_cell(cell)
+    source = cell.text
     # Use a space for execution_count if it's null, as per notebook format
-    exec_count = cell.get("execution_count") or " "
+    exec_count = cell.execution_count or " "
 
     # Determine if the cell has output to add a note
     no_output_note = ""
-    if not cell.get("outputs"):
+    if not cell.output_count:
         no_output_note = " [no output]"
 
     header = f"## Cell {cell_num} (code){no_output_note} [{exec_count}]"
@@ -27,120 +235,2069 @@ def format_code_cell(cell, cell_num):
     return f"{header}\n\n{code_block}\n\n"
 
 
-def format_output(output):
+class TableParser:
+    """
+    Streaming parser that collects the text of the first <table> in an HTML
+    document. Only the header, the first `max_rows` body rows and the first
+    `max_cols` columns are kept, but all body rows and columns seen are
+    counted. Rows inside <thead> (pandas writes two when the index is named)
+    go to `header_rows`; without a <thead>, the first row is the header.
+    Spanning cells (pandas' MultiIndex labels) are repeated into every column
+    and row they cover, so each row lines up with the header.
+    The tokenizing is done by an HTMLParser whose handlers are this object's.
+    """
+
+    def __init__(self, max_rows=MAX_TABLE_ROWS, max_cols=MAX_TABLE_COLS):
+        from html.parser import HTMLParser
+
+        self._parser = HTMLParser(convert_charrefs=True)
+        self._parser.handle_starttag = self.handle_starttag
+        self._parser.handle_endtag = self.handle_endtag
+        self._parser.handle_data = self.handle_data
+        self.max_rows = max_rows
+        self.max_cols = max_cols
+        self.header_rows = []
+        self.rows = []
+        self.total_rows = 0
+        self.total_cols = 0
+        self.done = False
+        self._depth = 0  # nesting level of <table> elements
+        self._in_head = False
+        self._row = None
+        self._row_cols = 0
+        self._in_row = False
+        self._cell = None
+        self._cell_spans = (1, 1)
+        self._spans = {}  # column -> [rows left, text] of cells with a rowspan
+
+    def feed(self, data):
+        self._parser.feed(data)
+
+    def close(self):
+        self._parser.close()
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "table":
+            self._depth += 1
+        elif self._depth != 1:
+            return
+        elif tag == "thead":
+            self._end_row()
+            self._in_head = True
+            self._spans.clear()
+        elif tag == "tr":
+            self._end_row()
+            # Without a <thead>, the first row counted is the header
+            limit = self.max_rows + (0 if self.header_rows else 1)
+            self._row = [] if self._in_head or self.total_rows < limit else None
+            self._row_cols = 0
+            self._in_row = True
+        elif tag in ("td", "th"):
+            self._end_cell()
+            attrs = dict(attrs)
+            self._cell = []
+            self._cell_spans = (
+                _span(attrs.get("rowspan"), MAX_ROWSPAN),
+                _span(attrs.get("colspan"), MAX_COLSPAN),
+            )
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if self.done or not self._depth:
+            return
+        if tag == "table":
+            self._depth -= 1
+            if not self._depth:
+                self._end_row()
+                self.done = True
+        elif self._depth != 1:
+            return
+        elif tag == "thead":
+            self._end_row()
+            self._in_head = False
+            self._spans.clear()
+        elif tag == "tr":
+            self._end_row()
+        elif tag in ("td", "th"):
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _place(self, text):
+        if self._row is not None and self._row_cols < self.max_cols:
+            self._row.append(text)
+        self._row_cols += 1
+
+    def _fill_spans(self):
+        """Places the cells of earlier rows that span down into this row."""
+        while self._row_cols in self._spans:
+            column = self._row_cols
+            span = self._spans[column]
+            self._place(span[1])
+            span[0] -= 1
+            if not span[0]:
+                del self._spans[column]
+
+    def _end_cell(self):
+        if self._cell is None:
+            return
+        text = " ".join("".join(self._cell).split()) if self._row is not None else ""
+        self._cell = None
+        if not self._in_row:
+            return
+        rowspan, colspan = self._cell_spans
+        self._fill_spans()
+        for _ in range(colspan):
+            if rowspan > 1:
+                self._spans[self._row_cols] = [rowspan - 1, text]
+            self._place(text)
+
+    def _end_row(self):
+        self._end_cell()
+        if self._in_row:
+            self._fill_spans()
+        self._in_row = False
+        if self._row_cols:
+            self.total_cols = max(self.total_cols, self._row_cols)
+            if self._in_head:
+                self.header_rows.append(self._row)
+            else:
+                self.total_rows += 1
+                if self._row is not None:
+                    self.rows.append(self._row)
+        self._row = None
+        self._row_cols = 0
+
+
+def _span(value, limit):
+    """Reads a rowspan/colspan attribute, clamped to 1..limit as browsers do."""
+    try:
+        return min(max(int(value), 1), limit)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _table_cell(text):
+    """Escapes text for use inside a Markdown table cell."""
+    return text.replace("\\", "\\\\").replace("|", "\\|")
+
+
+# Opening/closing <table>, <thead> and <tr> tags, used to count rows past the cap
+TABLE_ROW_TAG = re.compile(r"<(/?)(table|thead|tr)\b", re.IGNORECASE)
+
+
+def split_table(html, max_rows):
+    """
+    Splits an HTML document just before the row that follows the header and
+    `max_rows` body rows of its first table. Returns the prefix to parse and
+    the number of rows of that table after the split, counted by a regex
+    scan instead of the much slower HTMLParser. The header is every row in
+    <thead>, or else the first row.
+    """
+    depth = 0
+    in_head = False
+    head_rows = 0
+    rows = 0
+    keep = None
+    cut = None
+    for match in TABLE_ROW_TAG.finditer(html):
+        closing, tag = match.group(1), match.group(2).lower()
+        if tag == "table":
+            depth += -1 if closing else 1
+            if not depth:
+                break
+        elif depth != 1:
+            continue
+        elif tag == "thead":
+            in_head = not closing
+        elif closing:
+            continue
+        elif in_head:
+            head_rows += 1
+        else:
+            rows += 1
+            if keep is None:
+                keep = max_rows + (0 if head_rows else 1)
+            if rows == keep + 1:
+                cut = match.start()
+
+    if cut is None:
+        return html, 0
+    return html[:cut], rows - keep
+
+
+def html_table_to_markdown(html, max_rows=MAX_TABLE_ROWS, max_cols=MAX_TABLE_COLS):
+    """
+    Converts the first <table> of an HTML document into a Markdown table,
+    keeping at most `max_rows` body rows and `max_cols` columns. Returns None
+    if the document has no table rows.
+    """
+    head, skipped_rows = split_table(html, max_rows)
+    parser = TableParser(max_rows, max_cols)
+    parser.feed(head)
+    parser.close()
+    parser._end_row()
+
+    if not parser.rows and not parser.header_rows:
+        return None
+
+    width = min(parser.total_cols, max_cols)
+    rows = parser.header_rows + parser.rows
+    header_count = len(parser.header_rows) or 1
+    rows = [[_table_cell(text) for text in row] + [""] * (width - len(row)) for row in rows]
+    # Several header rows (a named index, MultiIndex columns) share one line
+    header = [" ".join(filter(None, column)) for column in zip(*rows[:header_count])]
+    body = rows[header_count:]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * width]
+    lines += ["| " + " | ".join(row) + " |" for row in body]
+
+    body_rows = parser.total_rows + skipped_rows - (0 if parser.header_rows else 1)
+    if body_rows > len(body) or parser.total_cols > width:
+        lines.append(
+            f"\n*(showing {len(body)} of {body_rows} rows, "
+            f"{width} of {parser.total_cols} columns)*"
+        )
+    return "\n".join(lines)
+
+
+def format_rich_data(data, max_table_rows=MAX_TABLE_ROWS, max_table_cols=MAX_TABLE_COLS):
+    """
+    Renders the body of an execute_result/display_data output: HTML tables
+    become Markdown tables, everything else falls back to `text/plain`.
+    Returns None if there is nothing to render.
+    """
+    if "text/html" in data:
+        html = join_source(data["text/html"])
+        if "<table" in html.lower():
+            table = html_table_to_markdown(html, max_table_rows, max_table_cols)
+            if table:
+                return f"{table}\n\n"
+    if "text/plain" in data:
+        text = join_source(data["text/plain"])
+        return f"```text\n{text.strip()}\n```\n\n"
+    return None
+
+
+def format_output(output, max_table_rows=MAX_TABLE_ROWS, max_table_cols=MAX_TABLE_COLS):
     """Formats a single output block from a code cell."""
-    output_type = output.get("output_type", "unknown")
+    output = as_output(output)
+    output_type = output.output_type
 
     if output_type == "stream":
         # stdout/stderr
-        text = "".join(output.get("text", ""))
+        text = join_source(output.text)
         return f"**Output (stream):**\n```text\n{text.strip()}\n```\n\n"
 
     elif output_type == "execute_result":
         # The return value of a cell
-        data = output.get("data", {})
-        if "text/plain" in data:
-            text = "".join(data["text/plain"])
-            return f"**Result:**\n```text\n{text.strip()}\n```\n\n"
+        body = format_rich_data(output.data, max_table_rows, max_table_cols)
+        if body:
+            return f"**Result:**\n{body}"
 
     elif output_type == "error":
         # Exceptions and tracebacks
-        traceback = "\n".join(output.get("traceback", []))
+        traceback = "\n".join(output.traceback)
         return f"**Error:**\n```ansi\n{traceback}\n```\n\n"
 
     elif output_type == "display_data":
         # Richer outputs like images or plots
-        data = output.get("data", {})
-        if "text/plain" in data:
-            text = "".join(data["text/plain"])
-            return f"**Display Data:**\n```text\n{text.strip()}\n```\n\n"
+        body = format_rich_data(output.data, max_table_rows, max_table_cols)
+        if body:
+            return f"**Display Data:**\n{body}"
 
     return ""  # Return empty string for unsupported or empty output types
 
 
-def convert_notebook(ipynb_path, output_path=None):
+class Selection:
     """
-    Converts a Jupyter Notebook (.ipynb) to a complete Markdown file,
-    ensuring no cells are dropped.
+    Which cells and outputs to convert: cell number ranges (1-based,
+    inclusive), cell tags, cell types and whether outputs are rendered.
+    The default selects everything.
     """
-    # 1. Load notebook
-    notebook_path = Path(ipynb_path)
-    with notebook_path.open("r", encoding="utf-8") as f:
-        nb = json.load(f)
 
-    # 2. Prepare output path
-    if output_path:
-        output_file = Path(output_path)
-    else:
-        output_file = notebook_path.with_suffix(".md")
+    __slots__ = ("ranges", "tags", "types", "outputs")
+
+    def __init__(self, ranges=(), tags=(), types=(), outputs=True):
+        self.ranges = tuple(ranges)
+        self.tags = frozenset(tags)
+        self.types = frozenset(types)
+        self.outputs = outputs
+
+    @property
+    def everything(self):
+        """Whether this selection keeps every cell and output."""
+        return not (self.ranges or self.tags or self.types) and self.outputs
+
+    @property
+    def last(self):
+        """The highest selected cell number (sys.maxsize when unbounded)."""
+        return max((high for _, high in self.ranges), default=sys.maxsize)
+
+    def wants_number(self, cell_num):
+        """Whether the cell number falls in the selected ranges."""
+        if not self.ranges:
+            return True
+        return any(low <= cell_num <= high for low, high in self.ranges)
+
+    def wants_type(self, cell_type):
+        return not self.types or cell_type in self.types
+
+    def wants_tags(self, tags):
+        return not self.tags or not self.tags.isdisjoint(tags)
+
+    def select(self, cells):
+        """Returns an iterator of the selected (cell number, Cell) pairs of a loaded notebook."""
+        if not (self.ranges or self.tags or self.types):
+            return enumerate(map(as_cell, cells), 1)
+        return self._select(cells)
+
+    def _select(self, cells):
+        last = self.last
+        for i, cell in enumerate(cells, 1):
+            if i > last:
+                break
+            if not self.wants_number(i):
+                continue
+            cell = as_cell(cell)
+            if self.wants_type(cell.cell_type) and self.wants_tags(cell.tags):
+                yield i, cell
+
+
+def parse_cell_ranges(text):
+    """Parses a cell range list such as "10-200", "5", "-20", "100-" or "1-3,8"."""
+    from argparse import ArgumentTypeError
+
+    ranges = []
+    for part in text.split(","):
+        low, sep, high = part.strip().partition("-")
+        try:
+            low = int(low) if low else 1
+            high = (int(high) if high else sys.maxsize) if sep else low
+        except ValueError:
+            raise ArgumentTypeError(f"invalid cell range: '{part}'") from None
+        if low < 1 or high < low:
+            raise ArgumentTypeError(f"invalid cell range: '{part}'")
+        ranges.append((low, high))
+    return ranges
+
+
+class LoadedNotebook:
+    """
+    Selected (cell number, Cell) pairs of a notebook parsed into memory.
+    As with StreamingNotebook, `total_cells` counts the cells up to the last
+    selected cell range.
+    """
+
+    def __init__(self, nb, selection=None):
+        self.cells = nb.get("cells", [])
+        self.selection = selection or Selection()
+        self.total_cells = min(len(self.cells), self.selection.last)
 
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    def __iter__(self):
+        return self.selection.select(self.cells)
 
-    # 3. Convert all cells
-    markdown_content = []
+
+# Byte patterns used by JsonScanner to jump over JSON text. A skip run covers
+# whitespace, scalars, short strings and containers without nested
+# containers, so Python only steps through the nesting brackets and long
+# strings (found with bytes.find, which is far faster than the regex engine).
+# The loops are unrolled so a failed match backtracks in linear time.
+_JSON_STRING = rb'"[^"\\]{0,512}(?:\\.[^"\\]{0,512})*"'
+_JSON_PLAIN = rb'[^"\[\]{}]*'
+_JSON_FLAT = _JSON_PLAIN + rb"(?:" + _JSON_STRING + _JSON_PLAIN + rb")*"
+JSON_SKIP_RUN = re.compile(
+    _JSON_PLAIN
+    + rb"(?:(?:"
+    + _JSON_STRING
+    + rb"|\["
+    + _JSON_FLAT
+    + rb"\]|\{"
+    + _JSON_FLAT
+    + rb"\})"
+    + _JSON_PLAIN
+    + rb")*",
+    re.DOTALL,
+)
+JSON_SCALAR = re.compile(rb"[^,:}\]\s]+")
+JSON_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+JSON_WHITESPACE_BYTES = frozenset(b" \t\n\r")
+JSON_PLAIN_KEY = re.compile(rb'[ \t\n\r]*"([^"\\]*)"[ \t\n\r]*:')
+JSON_SEPARATOR = re.compile(rb"[ \t\n\r]*([,}\]])")
+JSON_DECODER = json.JSONDecoder()
+NOTEBOOK_DECODER = json.JSONDecoder(object_hook=notebook_object_hook)
+BACKSLASH = ord("\\")
+
+
+class JsonScanner:
+    """
+    Incremental scanner over a JSON byte stream. Values can be decoded one at
+    a time, or skipped by a regex scan that never builds Python objects for
+    them, so unwanted subtrees cost little more than reading them from disk.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = bytearray()
+        self.pos = 0
+        self.offset = 0  # stream offset of buf[0], for error messages
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, "", self.offset + self.pos)
+
+    def _fill(self, keep_from):
+        """Drops the buffer before `keep_from` and appends a chunk; returns the shift."""
+        chunk = self.fp.read(self.CHUNK_SIZE)
+        if not chunk:
+            raise self._error("Unexpected end of notebook JSON")
+        del self.buf[:keep_from]
+        self.buf += chunk
+        self.pos -= keep_from
+        self.offset += keep_from
+        return keep_from
+
+    def peek(self):
+        """Skips whitespace and returns the next byte without consuming it."""
+        pos = self.pos
+        if pos < len(self.buf) and self.buf[pos] not in JSON_WHITESPACE_BYTES:
+            return self.buf[pos : pos + 1]
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos : self.pos + 1]
+            self._fill(self.pos)
+
+    def expect(self, token):
+        if self.peek() != token:
+            raise self._error(f"Expecting {token.decode()!r}")
+        self.pos += 1
+
+    def _more(self, i, keep):
+        """
+        Reads another chunk in the middle of a scan at index `i`. Skipped text
+        before `i` is dropped; kept text from `self.pos` on is retained.
+        Returns `i` adjusted for the dropped prefix.
+        """
+        if not keep:
+            self.pos = i
+        return i - self._fill(self.pos)
+
+    def _string_end(self, i, keep):
+        """Returns the index just past the closing quote of a string whose body starts at `i`."""
+        buf = self.buf
+        while True:
+            j = buf.find(b'"', i)
+            if j == -1:
+                # Keep a trailing run of backslashes so no escape is split
+                k = len(buf)
+                while k > i and buf[k - 1] == BACKSLASH:
+                    k -= 1
+                i = self._more(k, keep)
+                continue
+            k = j
+            while k > 0 and buf[k - 1] == BACKSLASH:
+                k -= 1
+            if (j - k) % 2 == 0:
+                return j + 1
+            i = j + 1
+
+    def _scan(self, keep, depth=0):
+        """
+        Moves past the next value, returning its raw bytes if `keep` is true.
+        With `depth=1` it instead moves past the rest of the current container.
+        """
+        self.peek()
+        buf = self.buf
+        i = self.pos
+        while True:
+            if i >= len(buf):
+                i = self._more(i, keep)
+                continue
+
+            c = buf[i : i + 1]
+            if c == b'"':
+                i = self._string_end(i + 1, keep)
+            elif c in b"{[":
+                depth += 1
+                i += 1
+            elif c in b"}]":
+                depth -= 1
+                i += 1
+            elif depth == 0:
+                m = JSON_SCALAR.match(buf, i)
+                if m is None:
+                    raise self._error("Expecting value")
+                if m.end() == len(buf):
+                    chunk = self.fp.read(self.CHUNK_SIZE)
+                    if chunk:
+                        buf += chunk
+                        continue
+                i = m.end()
+            else:
+                i = JSON_SKIP_RUN.match(buf, i).end()
+                continue
+
+            if depth <= 0:
+                break
+
+        if depth < 0:
+            raise self._error("Unexpected closing bracket")
+        start = self.pos
+        self.pos = i
+        return bytes(buf[start:i]) if keep else None
+
+    def read_value(self, decoder=JSON_DECODER):
+        """Decodes the next value."""
+        return decoder.decode(self._scan(keep=True).decode("utf-8"))
+
+    def read_key(self):
+        """Decodes the next object key and its colon, with a fast path for plain keys."""
+        m = JSON_PLAIN_KEY.match(self.buf, self.pos)
+        if m is None:
+            key = self.read_value()
+            self.expect(b":")
+            return key
+        self.pos = m.end()
+        return m.group(1).decode("utf-8")
+
+    def _separator(self):
+        """Consumes and returns the ',' or closing bracket after a member."""
+        m = JSON_SEPARATOR.match(self.buf, self.pos)
+        if m is None:
+            token = self.peek()
+            self.pos += 1
+            return token
+        self.pos = m.end()
+        return m.group(1)
+
+    def skip_value(self):
+        """Moves past the next value without decoding it."""
+        self._scan(keep=False)
+
+    def skip_rest(self):
+        """Moves past the remaining members and closing bracket of the current container."""
+        self._scan(keep=False, depth=1)
+
+    def _iter_members(self, close, read_key):
+        """Shared body of iter_object/iter_array."""
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield self.read_key() if read_key else None
+            token = self._separator()
+            if token == close:
+                return
+            if token != b",":
+                raise self._error(f"Expecting ',' or {close.decode()!r}")
+
+    def iter_object(self):
+        """Yields the keys of the next object; the caller consumes each value."""
+        self.expect(b"{")
+        return self._iter_members(b"}", read_key=True)
+
+    def iter_array(self):
+        """Yields once per element of the next array; the caller consumes each one."""
+        self.expect(b"[")
+        return self._iter_members(b"]", read_key=False)
+
+
+class StreamingNotebook:
+    """
+    Selected (cell number, Cell) pairs read straight from a notebook file.
+    Cells outside the selection, and outputs when they are not wanted, are
+    skipped without being decoded, and reading stops after the last selected
+    cell range. Once iterated, `total_cells` is the number of cells read.
+    """
+
+    def __init__(self, fp, selection):
+        self.scanner = JsonScanner(fp)
+        self.selection = selection
+        self.total_cells = 0
+
+    def __iter__(self):
+        scanner = self.scanner
+        last = self.selection.last
+        for key in scanner.iter_object():
+            if key != "cells":
+                scanner.skip_value()
+                continue
+            for _ in scanner.iter_array():
+                if self.total_cells == last:
+                    return
+                self.total_cells += 1
+                if not self.selection.wants_number(self.total_cells):
+                    scanner.skip_value()
+                    continue
+                cell = self._read_cell()
+                if cell is not None:
+                    yield self.total_cells, cell
+
+    def _read_cell(self):
+        """Reads one cell object, skipping whatever the selection rules out."""
+        scanner = self.scanner
+        selection = self.selection
+        fields = {}
+        output_count = 0
+        wanted = True
+
+        for key in scanner.iter_object():
+            if not wanted:
+                scanner.skip_value()
+                scanner.skip_rest()
+                return None
+            if key == "cell_type":
+                fields["cell_type"] = scanner.read_value()
+                wanted = selection.wants_type(fields["cell_type"])
+            elif key == "metadata" and selection.tags:
+                tags = (scanner.read_value() or {}).get("tags", ())
+                fields["tags"] = tuple(tags)
+                wanted = selection.wants_tags(tags)
+            elif key in ("source", "execution_count"):
+                fields[key] = scanner.read_value()
+            elif key == "outputs":
+                if selection.outputs:
+                    fields["outputs"] = scanner.read_value(NOTEBOOK_DECODER)
+                    output_count = len(fields["outputs"])
+                else:
+                    for _ in scanner.iter_array():
+                        scanner.skip_value()
+                        output_count += 1
+            else:
+                scanner.skip_value()
+
+        if not wanted or not selection.wants_type(fields.get("cell_type")):
+            return None
+        if not selection.wants_tags(fields.get("tags", ())):
+            return None
+        return Cell(
+            fields.get("cell_type"),
+            fields.get("source", ""),
+            fields.get("execution_count"),
+            fields.get("outputs", ()),
+            fields.get("tags", ()),
+            output_count,
+        )
+
+
+# Notebook files from this size up are streamed from disk when only part of
+# them is selected. Streaming keeps memory flat, but the byte scanner is
+# slower than json.load, so smaller files are loaded and then selected from.
+STREAM_THRESHOLD = 64 * 1024 * 1024
+
+
+def streams(selection, size, stream_threshold=STREAM_THRESHOLD):
+    """Whether a `size`-byte notebook file is read with StreamingNotebook."""
+    return selection is not None and not selection.everything and size >= stream_threshold
+
+
+def write_cells(cells, out, outputs=True, on_cell=None, **options):
+    """
+    Writes the Markdown for numbered cells to the text stream `out`,
+    fragment by fragment, so the rendered document is never held in memory
+    as a whole. Returns counts of cells with outputs and of outputs
+    rendered. `on_cell(cell_num, cell)` is called for every rendered cell,
+    and `options` are passed on to `format_output`.
+    """
     cells_with_outputs = 0
-    total_cells = len(nb.get("cells", []))
+    total_outputs = 0
 
-    for i, cell in enumerate(nb.get("cells", []), 1):
-        cell_type = cell.get("cell_type")
+    for i, cell in cells:
+        cell_type = cell.cell_type
+        if on_cell and cell_type in ("markdown", "code"):
+            on_cell(i, cell)
         if cell_type == "markdown":
-            markdown_content.append(format_markdown_cell(cell, i))
+            out.write(format_markdown_cell(cell, i))
         elif cell_type == "code":
-            markdown_content.append(format_code_cell(cell, i))
+            out.write(format_code_cell(cell, i))
 
-            if cell.get("outputs"):
+            if cell.output_count:
                 cells_with_outputs += 1
-                for output in cell["outputs"]:
-                    markdown_content.append(format_output(output))
+            if outputs:
+                for output in cell.outputs:
+                    total_outputs += 1
+                    out.write(format_output(output, **options))
+
+    return {"cells_with_outputs": cells_with_outputs, "total_outputs": total_outputs}
+
+
+def write_markdown(nb, out, selection=None, **options):
+    """
+    Writes the Markdown for the selected cells (by default all of them) of
+    a loaded notebook to the text stream `out`. See `write_cells`.
+    """
+    selection = selection or Selection()
+    return write_cells(LoadedNotebook(nb, selection), out, selection.outputs, **options)
+
+
+STDIO_PATH = "-"
+
+# Output file suffixes written through a stdlib compressor
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".xz": "xz", ".bz2": "bz2"}
+COMPRESSION_DEFAULT_SUFFIX = {codec: suffix for suffix, codec in COMPRESSION_SUFFIXES.items()}
+
+FRAME_DELIMITERS = {"nul": b"\0", "newline": b"\n"}
+
+
+class Utf8Writer:
+    """
+    Text-stream adapter over a binary stream (such as `sys.stdout.buffer`)
+    that encodes each fragment once and counts the bytes written.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_written = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.bytes_written += len(data)
+        self.stream.write(data)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def open_markdown(path, compression=None, level=None):
+    """
+    Opens a Markdown output file as a text stream. The file is compressed
+    with `compression` ("gzip", "xz" or "bz2"), or else with the codec its
+    suffix names, so rendered fragments stream through the compressor and
+    uncompressed Markdown is never held in memory or written to disk.
+    `level` is the compression level (0-9; the codec's default if None).
+    """
+    compression = compression or COMPRESSION_SUFFIXES.get(path.suffix)
+    if compression == "gzip":
+        import gzip
+
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=9 if level is None else level)
+    if compression == "bz2":
+        import bz2
+
+        return bz2.open(path, "wt", encoding="utf-8", compresslevel=9 if level is None else level)
+    if compression == "xz":
+        import lzma
+
+        return lzma.open(path, "wt", encoding="utf-8", preset=level)
+    return path.open("w", encoding="utf-8")
+
+
+def render_stats(notebook, out, started, loaded, selection=None, **options):
+    """
+    Renders the selected cells of a LoadedNotebook/StreamingNotebook to `out`
+    and returns the conversion stats.
+    """
+    outputs = selection.outputs if selection else True
+    counts = write_cells(notebook, out, outputs, **options)
+    rendered = time.perf_counter()
+    return {
+        "total_cells": notebook.total_cells,
+        "cells_with_outputs": counts["cells_with_outputs"],
+        "total_outputs": counts["total_outputs"],
+        "load_seconds": loaded - started,
+        "render_seconds": rendered - loaded,
+    }
+
+
+def markdown_path(notebook_path, compression=None):
+    """Returns the default output path next to a notebook: .md, or .md.gz etc."""
+    suffix = ".md" + COMPRESSION_DEFAULT_SUFFIX.get(compression, "")
+    return Path(notebook_path).with_suffix(suffix)
+
+
+def convert_notebook(
+    ipynb_path,
+    output_path=None,
+    selection=None,
+    index=None,
+    compression=None,
+    compress_level=None,
+    stream_threshold=STREAM_THRESHOLD,
+    **options,
+):
+    """
+    Converts a Jupyter Notebook (.ipynb) to a complete Markdown file,
+    ensuring no cells are dropped.
+
+    Passing "-" as `ipynb_path` reads the notebook from stdin, and passing
+    "-" as `output_path` streams the Markdown to stdout. A notebook read
+    from stdin is written to stdout unless an output path is given.
+    A `selection` limits the cells and outputs converted; a notebook file of
+    at least `stream_threshold` bytes is then streamed from disk, skipping
+    what is not selected. A SearchIndex
+    `index` receives the converted cells of a whole notebook file (it cannot
+    be combined with a selection) whenever the file changed since it was
+    last indexed. The output file is compressed
+    when `compression` is given or its suffix is .gz, .xz or .bz2 (see
+    `open_markdown`). Rendering `options` (such as `max_table_rows`) go to
+    `format_output`.
+    """
+    if index is not None and ipynb_path == STDIO_PATH:
+        raise ValueError("Only notebook files can be indexed")
+    if index is not None and selection is not None and not selection.everything:
+        raise ValueError("Only whole notebooks can be indexed")
+
+    with ExitStack() as stack:
+        # Neither parsing nor rendering creates reference cycles (see gc_paused)
+        stack.enter_context(gc_paused())
+
+        # 1. Load notebook, or open a large one for streaming when only part is wanted
+        started = time.perf_counter()
+        if ipynb_path == STDIO_PATH:
+            raw = sys.stdin.buffer.read()
+            notebook = LoadedNotebook(loads_notebook(raw), selection)
+            bytes_in = len(raw)
+            del raw
+        else:
+            notebook_path = Path(ipynb_path)
+            bytes_in = notebook_path.stat().st_size
+            if streams(selection, bytes_in, stream_threshold):
+                f = stack.enter_context(notebook_path.open("rb"))
+                notebook = StreamingNotebook(f, selection)
+            else:
+                with notebook_path.open("r", encoding="utf-8") as f:
+                    notebook = LoadedNotebook(load_notebook(f), selection)
+        loaded = time.perf_counter()
+
+        # 2. Prepare the destination: stdout, or the output file
+        if output_path == STDIO_PATH or (not output_path and ipynb_path == STDIO_PATH):
+            output_file = None
+            out = Utf8Writer(sys.stdout.buffer)
+        else:
+            if output_path:
+                output_file = Path(output_path)
+            else:
+                output_file = markdown_path(notebook_path, compression)
+
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            if output_file.is_file() and output_file.stat().st_nlink > 1:
+                output_file.unlink()  # a --dedup hardlink: don't rewrite its siblings
+            out = stack.enter_context(open_markdown(output_file, compression, compress_level))
+
+        # 3. Convert all cells, writing each fragment as it is produced
+        indexing = index is not None and index.begin(notebook_path, output_file)
+        if indexing:
+            options["on_cell"] = index.add_cell
+        try:
+            stats = render_stats(notebook, out, started, loaded, selection, **options)
+        except BaseException:
+            if indexing:
+                index.rollback()
+            raise
+        if indexing:
+            index.commit()
+        out.flush()
+
+    # 4. Return stats for summary
+    if output_file is None:
+        stats.update(output_path=STDIO_PATH, bytes_in=bytes_in, bytes_out=out.bytes_written)
+    else:
+        stats.update(
+            output_path=str(output_file),
+            bytes_in=bytes_in,
+            bytes_out=output_file.stat().st_size,
+        )
+    return stats
+
+
+def iter_frames(stream, delimiter):
+    """
+    Yields the delimiter-separated documents of a binary stream as they
+    arrive, skipping empty frames. Only newly read data is searched for the
+    (single-byte) delimiter, and a frame is joined once when it ends, so
+    time stays linear in the frame size.
+    """
+    pending = []
+    while True:
+        chunk = stream.read1(1 << 16) if hasattr(stream, "read1") else stream.read(1 << 16)
+        if not chunk:
+            break
+        parts = chunk.split(delimiter)
+        if len(parts) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(parts[0])
+        for frame in [b"".join(pending)] + parts[1:-1]:
+            if frame.strip():
+                yield frame
+        pending = [parts[-1]]
+    frame = b"".join(pending)
+    if frame.strip():
+        yield frame
+
+
+def convert_frame(frame, out, selection=None, **options):
+    """
+    Converts one framed notebook document to Markdown on `out`, followed by
+    a NUL byte (the one delimiter that cannot occur in Markdown text). The
+    NUL is written even when conversion fails, so downstream consumers stay
+    aligned with the input frames.
+    """
+    started = time.perf_counter()
+    try:
+        notebook = LoadedNotebook(loads_notebook(frame), selection)
+        before = out.bytes_written
+        stats = render_stats(notebook, out, started, time.perf_counter(), selection, **options)
+        stats.update(
+            output_path=STDIO_PATH,
+            bytes_in=len(frame),
+            bytes_out=out.bytes_written - before,
+        )
+        return stats
+    finally:
+        out.write("\0")
+        out.flush()
+
+
+def file_identity(notebook_path):
+    """Returns the (resolved path, size, mtime) of a file, or None if it is missing."""
+    try:
+        path = Path(notebook_path).resolve()
+        st = path.stat()
+    except OSError:
+        return None
+    return (str(path), st.st_size, st.st_mtime_ns)
+
+
+class Journal:
+    """
+    Append-only JSON-lines journal of converted notebooks. A notebook is
+    skipped by later runs as long as its size and modification time match
+    the journal entry, so an interrupted batch resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.completed = set()
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # line torn by a crash mid-write
+                    self.completed.add((entry["path"], entry["size"], entry["mtime_ns"]))
+
+    def is_done(self, notebook_path):
+        """Whether this exact version of the notebook was already converted."""
+        return file_identity(notebook_path) in self.completed
+
+    def record(self, notebook_path, stats):
+        """Appends a completed conversion and syncs it to disk."""
+        key = file_identity(notebook_path)
+        if key is None:
+            return
+        entry = {
+            "path": key[0],
+            "size": key[1],
+            "mtime_ns": key[2],
+            "output_path": stats["output_path"],
+            "finished_at": round(time.time(), 3),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.add(key)
 
-    # 4. Write to file
-    output_text = "".join(markdown_content)
-    output_file.write_text(output_text, encoding="utf-8")
 
-    # 5. Return stats for summary
+class WorkQueue:
+    """
+    File-based work queue shared by independent worker processes, possibly
+    on several machines with a shared filesystem. Each notebook gets a lock
+    file created with O_EXCL; a lock older than `lease` seconds belongs to a
+    dead worker and may be taken over. While a worker holds a lock, a
+    background thread touches it every `lease / 3` seconds, so a slow
+    conversion keeps its lease. Converted notebooks get a done marker
+    recording the notebook's size and mtime; a notebook changed since is
+    converted again, as with `Journal`.
+    """
+
+    def __init__(self, directory, lease=600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lease = lease
+        import socket
+
+        self.owner = f"{socket.gethostname()}.{os.getpid()}"
+        self._renewals = {}  # lock path -> Event stopping its renewal thread
+
+    def _paths(self, notebook_path):
+        import hashlib
+
+        key = hashlib.sha1(str(Path(notebook_path).resolve()).encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.lock", self.directory / f"{key}.done"
+
+    def _expired(self, lock):
+        try:
+            return time.time() - lock.stat().st_mtime > self.lease
+        except FileNotFoundError:
+            return True
+
+    def _is_done(self, notebook_path, done):
+        try:
+            entry = json.loads(done.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        key = file_identity(notebook_path)
+        return key is not None and (entry.get("size"), entry.get("mtime_ns")) == key[1:]
+
+    def _renew(self, lock):
+        """Keeps touching a held lock until it is released or taken over."""
+        import threading
+
+        stop = threading.Event()
+
+        def touch():
+            while not stop.wait(self.lease / 3):
+                try:
+                    os.utime(lock)
+                except FileNotFoundError:
+                    return
+
+        self._renewals[lock] = stop
+        threading.Thread(target=touch, daemon=True).start()
+
+    def claim(self, notebook_path):
+        """Tries to take the lease on a notebook; returns False if done or held."""
+        lock, done = self._paths(notebook_path)
+        if self._is_done(notebook_path, done):
+            return False
+
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._expired(lock):
+                    return False
+                # Take over the expired lease. Renaming is atomic, so only one
+                # worker wins; if the lock turns out to have been renewed in
+                # the meantime, put it back and give up.
+                stale = lock.with_name(f"{lock.name}.{self.owner}.stale")
+                try:
+                    os.rename(lock, stale)
+                except FileNotFoundError:
+                    continue
+                if not self._expired(stale):
+                    try:
+                        os.link(stale, lock)
+                    except FileExistsError:
+                        pass
+                    os.unlink(stale)
+                    return False
+                os.unlink(stale)
+                continue
+
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"owner": self.owner, "claimed_at": time.time()}))
+            if self._is_done(notebook_path, done):  # finished by another worker meanwhile
+                self.release(notebook_path)
+                return False
+            if self.lease > 0:
+                self._renew(lock)
+            return True
+
+        return False
+
+    def complete(self, notebook_path):
+        """Marks a claimed notebook as converted and drops its lock."""
+        lock, done = self._paths(notebook_path)
+        key = file_identity(notebook_path)
+        if key is not None:
+            entry = {"owner": self.owner, "size": key[1], "mtime_ns": key[2]}
+            tmp = done.with_name(f"{done.name}.{self.owner}.tmp")
+            tmp.write_text(json.dumps(entry), encoding="utf-8")
+            os.replace(tmp, done)
+        self.release(notebook_path)
+
+    def release(self, notebook_path):
+        """Drops the lock on a notebook so another worker can retry it."""
+        lock, _ = self._paths(notebook_path)
+        stop = self._renewals.pop(lock, None)
+        if stop:
+            stop.set()
+        try:
+            os.unlink(lock)
+        except FileNotFoundError:
+            pass
+
+
+# How `--dedup` decides that two notebooks are the same: identical bytes, or
+# identical cell types and sources (ignoring outputs, execution counts and
+# metadata).
+DEDUP_MODES = ("content", "source")
+
+
+def notebook_hash(notebook_path, mode="content", stream_threshold=STREAM_THRESHOLD):
+    """
+    Returns the dedup key of a notebook file, or None if it cannot be read
+    (the conversion then reports the error). Source hashes read the cells
+    without their outputs (see `read_cells`).
+    """
+    import hashlib
+
+    try:
+        if mode == "source":
+            cells = read_cells(notebook_path, outputs=False, stream_threshold=stream_threshold)
+            return _digest(*(cell.digest for _, cell in cells))
+        with open(notebook_path, "rb") as f:
+            h = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+            return h.hexdigest()
+    except (OSError, ValueError):
+        return None
+
+
+def fan_out(source_path, target_path, link="hardlink"):
+    """
+    Puts a copy of an already converted Markdown file at `target_path`, as a
+    hardlink when possible (falling back to a copy across filesystems) or as
+    an independent copy.
+    """
+    source, target = Path(source_path), Path(target_path)
+    if target.exists() and os.path.samefile(source, target):
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    if link == "hardlink":
+        try:
+            os.link(source, tmp)
+        except OSError:
+            link = "copy"
+    if link == "copy":
+        import shutil
+
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+# Characters of output text stored per cell in the search index
+MAX_INDEXED_OUTPUT_CHARS = 4000
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+# Cell rowids in the index are (notebook id << CELL_ID_BITS) | cell number, so
+# all cells of a notebook can be replaced with a cheap rowid range delete.
+CELL_ID_BITS = 20
+
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notebooks (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    markdown_path TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS cells USING fts5(cell_type UNINDEXED, source, outputs);
+"""
+
+
+def output_text(output):
+    """Returns the plain text of an output, as indexed for search."""
+    output = as_output(output)
+    if output.output_type == "stream":
+        return join_source(output.text)
+    if output.output_type == "error":
+        return ANSI_ESCAPE.sub("", "\n".join(output.traceback))
+    return join_source(output.data.get("text/plain", ""))
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 full-text index of converted cells, keyed by notebook path
+    and cell number. A notebook is only re-indexed when its size or
+    modification time changed since it was last indexed.
+    """
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        try:
+            self.db.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.db.close()
+            raise RuntimeError(f"SQLite FTS5 is not available: {e}") from e
+        self._notebook_id = None
+
+    def begin(self, notebook_path, markdown_path=None):
+        """
+        Starts re-indexing a notebook and returns True, or returns False if
+        the index is already up to date for this version of the file.
+        """
+        path, size, mtime_ns = file_identity(notebook_path)
+        row = self.db.execute(
+            "SELECT id, size, mtime_ns FROM notebooks WHERE path = ?", (path,)
+        ).fetchone()
+        if row and row[1:] == (size, mtime_ns):
+            return False
+
+        self.db.execute("BEGIN IMMEDIATE")
+        if row:
+            notebook_id = row[0]
+            self.db.execute(
+                "DELETE FROM cells WHERE rowid BETWEEN ? AND ?",
+                (notebook_id << CELL_ID_BITS, ((notebook_id + 1) << CELL_ID_BITS) - 1),
+            )
+            self.db.execute(
+                "UPDATE notebooks SET size = ?, mtime_ns = ?, markdown_path = ? WHERE id = ?",
+                (size, mtime_ns, markdown_path and str(markdown_path), notebook_id),
+            )
+        else:
+            notebook_id = self.db.execute(
+                "INSERT INTO notebooks (path, size, mtime_ns, markdown_path) VALUES (?, ?, ?, ?)",
+                (path, size, mtime_ns, markdown_path and str(markdown_path)),
+            ).lastrowid
+        self._notebook_id = notebook_id
+        return True
+
+    def add_cell(self, cell_num, cell):
+        """Indexes the source and trimmed output text of one cell."""
+        outputs = []
+        budget = MAX_INDEXED_OUTPUT_CHARS
+        for output in cell.outputs:
+            if budget <= 0:
+                break
+            text = output_text(output)[:budget]
+            outputs.append(text)
+            budget -= len(text)
+        self.db.execute(
+            "INSERT INTO cells (rowid, cell_type, source, outputs) VALUES (?, ?, ?, ?)",
+            (
+                (self._notebook_id << CELL_ID_BITS) | cell_num,
+                cell.cell_type,
+                cell.text,
+                "\n".join(outputs),
+            ),
+        )
+
+    def commit(self):
+        self.db.execute("COMMIT")
+        self._notebook_id = None
+
+    def rollback(self):
+        self.db.execute("ROLLBACK")
+        self._notebook_id = None
+
+    def search(self, query, limit=20):
+        """Returns the best matching cells for an FTS5 query, best first."""
+        rows = self.db.execute(
+            """
+            SELECT n.path, n.markdown_path, hit.rowid & ?, hit.cell_type, hit.snippet
+            FROM (
+                SELECT rowid, cell_type, snippet(cells, -1, '[', ']', '...', 12) AS snippet
+                FROM cells WHERE cells MATCH ? ORDER BY rank LIMIT ?
+            ) AS hit
+            JOIN notebooks AS n ON n.id = hit.rowid >> ?
+            """,
+            ((1 << CELL_ID_BITS) - 1, query, limit, CELL_ID_BITS),
+        )
+        return [
+            {
+                "path": path,
+                "markdown_path": markdown_path,
+                "cell": cell_num,
+                "cell_type": cell_type,
+                "snippet": " ".join(snippet.split()),
+            }
+            for path, markdown_path, cell_num, cell_type, snippet in rows
+        ]
+
+    def close(self):
+        self.db.close()
+
+
+def search_main(argv):
+    """Entry point of `jmd search`: queries an index built with --index."""
+    import sqlite3
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog="jmd search", description="Search notebooks indexed with --index."
+    )
+    parser.add_argument("index_path", help="Path to the SQLite index database.")
+    parser.add_argument("query", help="FTS5 query, e.g. 'read_csv' or 'pandas AND plot'.")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Maximum hits (default: 20).")
+    args = parser.parse_args(argv)
+
+    if not Path(args.index_path).exists():
+        print(f"[ERROR] Error: Index not found at '{args.index_path}'", file=sys.stderr)
+        sys.exit(1)
+
+    index = SearchIndex(args.index_path)
+    try:
+        hits = index.search(args.query, args.limit)
+    except sqlite3.OperationalError as e:
+        print(f"[ERROR] Error: Invalid search query: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        index.close()
+
+    for hit in hits:
+        target = hit["markdown_path"] or hit["path"]
+        # Matches the `## Cell N (type)` header of the converted Markdown
+        print(f"{target} (Cell {hit['cell']}, {hit['cell_type']}): {hit['snippet']}")
+    if not hits:
+        sys.exit(1)
+
+
+# Largest gap (old cells x new cells) aligned with a quadratic LCS when no
+# unique anchors are left; bigger gaps are reported as replaced cells.
+LCS_LIMIT = 250_000
+
+# Unaligned cells facing each other in a gap are paired as one edited cell
+# when the similarity ratio of their source lines (words, for sources of
+# fewer than SHORT_SOURCE_LINES lines) reaches this threshold. Pairing a gap
+# stops once PAIRING_BUDGET tokens have been compared.
+SIMILARITY_THRESHOLD = 0.5
+SHORT_SOURCE_LINES = 4
+PAIRING_BUDGET = 1_000_000
+
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """
+    Returns the (i, j) pairs of keys occurring exactly once in both ranges,
+    reduced to their longest increasing subsequence in j (patience sorting).
+    """
+    from bisect import bisect_left
+
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [0, i, 0, 0])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[2] += 1
+            entry[3] = j
+    pairs = sorted((i, j) for n_a, i, n_b, j in counts.values() if n_a == 1 and n_b == 1)
+
+    tails = []  # j of the smallest tail of each increasing run length
+    tail_index = []
+    previous = [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        previous[k] = tail_index[pos - 1] if pos else None
+
+    anchors = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        anchors.append(pairs[k])
+        k = previous[k]
+    return anchors[::-1]
+
+
+def _lcs(a, alo, ahi, b, blo, bhi):
+    """Classic dynamic-programming LCS of two small ranges; returns matched pairs."""
+    n, m = ahi - alo, bhi - blo
+    lengths = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        for j in range(m - 1, -1, -1):
+            if a[alo + i] == b[blo + j]:
+                lengths[i][j] = lengths[i + 1][j + 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+
+    pairs = []
+    i = j = 0
+    while i < n and j < m:
+        if a[alo + i] == b[blo + j]:
+            pairs.append((alo + i, blo + j))
+            i += 1
+            j += 1
+        elif lengths[i + 1][j] >= lengths[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+def align_keys(a, b):
+    """
+    Aligns two sequences of hashable keys with a patience diff: common
+    prefixes and suffixes match directly, keys unique to both sides anchor
+    the alignment, and small leftover gaps fall back to a classic LCS.
+    Near-linear for typical edits. Returns matched (i, j) pairs in order.
+    """
+    matches = []
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        alo, ahi, blo, bhi = ranges.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            for i, j in anchors:
+                matches.append((i, j))
+                ranges.append((alo, i, blo, j))
+                alo, blo = i + 1, j + 1
+            ranges.append((alo, ahi, blo, bhi))
+        elif (ahi - alo) * (bhi - blo) <= LCS_LIMIT:
+            matches.extend(_lcs(a, alo, ahi, b, blo, bhi))
+
+    matches.sort()
+    return matches
+
+
+def outputs_digest(cell):
+    """Hash of all outputs of a cell, in order."""
+    return _digest(*(as_output(output).digest for output in cell.outputs))
+
+
+def _similar(old, new):
+    """
+    Whether two token sequences (lines or words of cell sources) are similar
+    enough to count as one edited cell. The cheap upper bounds of the ratio
+    are checked first, so most dissimilar pairs are rejected without a diff.
+    """
+    from difflib import SequenceMatcher
+
+    matcher = SequenceMatcher(None, old, new)
+    return (
+        matcher.real_quick_ratio() >= SIMILARITY_THRESHOLD
+        and matcher.quick_ratio() >= SIMILARITY_THRESHOLD
+        and matcher.ratio() >= SIMILARITY_THRESHOLD
+    )
+
+
+def _pair_gap(removed, added):
+    """
+    Pairs each unaligned old cell with the next similar new cell of the same
+    type as "changed", keeping order; the rest are "removed" or "added".
+    """
+    entries = []
+    # (lines, words) of each source, split once however often it is compared
+    tokens = {id(cell): (cell.text.splitlines(), cell.text.split()) for _, cell in removed + added}
+    budget = PAIRING_BUDGET
+    j = 0
+    for old in removed:
+        match = None
+        old_lines, old_words = tokens[id(old[1])]
+        for k in range(j, len(added)):
+            new = added[k]
+            if new[1].cell_type != old[1].cell_type:
+                continue
+            new_lines, new_words = tokens[id(new[1])]
+            if min(len(old_lines), len(new_lines)) < SHORT_SOURCE_LINES:
+                old_tokens, new_tokens = old_words, new_words
+            else:
+                old_tokens, new_tokens = old_lines, new_lines
+            budget -= len(old_tokens) + len(new_tokens)
+            if budget < 0:
+                break
+            if _similar(old_tokens, new_tokens):
+                match = k
+                break
+        if match is None:
+            entries.append(("removed", old, None))
+        else:
+            entries.extend(("added", None, new) for new in added[j:match])
+            entries.append(("changed", old, added[match]))
+            j = match + 1
+    entries.extend(("added", None, new) for new in added[j:])
+    return entries
+
+
+def diff_cells(old_cells, new_cells, outputs=True):
+    """
+    Compares two lists of (cell number, Cell) pairs. Cells are aligned on
+    the hash of their type and source; aligned cells whose outputs differ
+    count as changed when `outputs` is true. Unaligned cells left in a gap
+    are paired as changed when their sources are similar. Returns a list of
+    (status, old pair, new pair) with status "added", "removed" or
+    "changed" and None for the missing side. Raw cells are left out, as
+    they are by conversion.
+    """
+    old_cells = [(num, cell) for num, cell in old_cells if cell.cell_type in ("markdown", "code")]
+    new_cells = [(num, cell) for num, cell in new_cells if cell.cell_type in ("markdown", "code")]
+    matches = align_keys(
+        [cell.digest for _, cell in old_cells], [cell.digest for _, cell in new_cells]
+    )
+    entries = []
+    i = j = 0
+    for mi, mj in matches + [(len(old_cells), len(new_cells))]:
+        entries += _pair_gap(old_cells[i:mi], new_cells[j:mj])
+        if mi < len(old_cells):
+            old, new = old_cells[mi], new_cells[mj]
+            if outputs and outputs_digest(old[1]) != outputs_digest(new[1]):
+                entries.append(("changed", old, new))
+        i, j = mi + 1, mj + 1
+    return entries
+
+
+def format_cell(cell_num, cell, outputs=True, **options):
+    """Formats a whole cell, with its outputs unless `outputs` is false."""
+    if cell.cell_type == "markdown":
+        return format_markdown_cell(cell, cell_num)
+    if cell.cell_type != "code":
+        return ""
+    parts = [format_code_cell(cell, cell_num)]
+    if outputs:
+        parts += [format_output(output, **options) for output in cell.outputs]
+    return "".join(parts)
+
+
+def _with_note(markdown, note):
+    """Appends a bracketed note to the `## Cell N` header line of formatted Markdown."""
+    header, _, body = markdown.partition("\n")
+    return f"{header} [{note}]\n{body}"
+
+
+def format_diff_entry(status, old, new, outputs=True, **options):
+    """Formats one diff entry in the `## Cell N` format, marking its status."""
+    from difflib import unified_diff
+
+    if status == "added":
+        return _with_note(format_cell(*new, outputs, **options), "added")
+    if status == "removed":
+        return _with_note(format_cell(*old, outputs, **options), "removed")
+
+    (old_num, old_cell), (new_num, new_cell) = old, new
+    note = "changed" if old_num == new_num else f"changed, was Cell {old_num}"
+    header = format_cell(new_num, new_cell, outputs=False).partition("\n")[0]
+    if old_cell.digest == new_cell.digest:
+        parts = [f"{header} [outputs {note}]\n\n"]
+    else:
+        source_diff = unified_diff(
+            old_cell.text.splitlines(), new_cell.text.splitlines(), lineterm="", n=2
+        )
+        lines = list(source_diff)[2:]  # drop the ---/+++ file header
+        parts = [f"{header} [{note}]\n\n```diff\n" + "\n".join(lines) + "\n```\n\n"]
+    if outputs and new_cell.cell_type == "code" and (
+        outputs_digest(old_cell) != outputs_digest(new_cell)
+    ):
+        parts += [format_output(output, **options) for output in new_cell.outputs]
+    return "".join(parts)
+
+
+def read_cells(ipynb_path, outputs=True, stream_threshold=STREAM_THRESHOLD):
+    """
+    Returns all (cell number, Cell) pairs of a notebook file. Without
+    `outputs`, a file of at least `stream_threshold` bytes is streamed and
+    its outputs are skipped unparsed.
+    """
+    notebook_path = Path(ipynb_path)
+    selection = Selection(outputs=outputs)
+    with gc_paused():
+        if streams(selection, notebook_path.stat().st_size, stream_threshold):
+            with notebook_path.open("rb") as f:
+                return list(StreamingNotebook(f, selection))
+        with notebook_path.open("r", encoding="utf-8") as f:
+            return list(LoadedNotebook(load_notebook(f), selection))
+
+
+def diff_main(argv):
+    """Entry point of `jmd diff`: shows the cells that differ between two notebooks."""
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog="jmd diff",
+        description="Show added, removed and changed cells between two notebook versions.",
+    )
+    parser.add_argument("old_path", help="Path to the old .ipynb notebook.")
+    parser.add_argument("new_path", help="Path to the new .ipynb notebook.")
+    parser.add_argument("-o", "--output", help="Write the diff to this file instead of stdout.")
+    parser.add_argument(
+        "--ignore-outputs",
+        action="store_true",
+        help="Compare and show cell sources only; outputs are skipped unparsed.",
+    )
+    args = parser.parse_args(argv)
+    outputs = not args.ignore_outputs
+
+    try:
+        old_cells = read_cells(args.old_path, outputs)
+        new_cells = read_cells(args.new_path, outputs)
+    except (OSError, json.JSONDecodeError) as e:
+        path = getattr(e, "filename", None) or args.old_path
+        print(error_message(path, e), file=sys.stderr)
+        sys.exit(2)
+
+    entries = diff_cells(old_cells, new_cells, outputs)
+    counts = {status: 0 for status in ("added", "removed", "changed")}
+    for status, _, _ in entries:
+        counts[status] += 1
+
+    with ExitStack() as stack:
+        if args.output:
+            out = stack.enter_context(open_markdown(Path(args.output)))
+        else:
+            out = sys.stdout
+        out.write(
+            f"**Diff:** `{args.old_path}` -> `{args.new_path}`: "
+            f"{counts['added']} added, {counts['removed']} removed, {counts['changed']} changed\n\n"
+        )
+        for entry in entries:
+            out.write(format_diff_entry(*entry, outputs))
+
+    if entries:
+        sys.exit(1)
+
+
+def error_message(notebook_path, error):
+    """Returns the human-readable message printed for a failed conversion."""
+    if isinstance(error, FileNotFoundError):
+        return f"[ERROR] Error: Input file not found at '{notebook_path}'"
+    if isinstance(error, json.JSONDecodeError):
+        return "[ERROR] Error: Could not parse the notebook file. It might be corrupted."
+    return f"[ERROR] An unexpected error occurred: {error}"
+
+
+def notebook_record(
+    notebook_path, stats=None, error=None, duration=0.0, status=None, duplicate_of=None
+):
+    """
+    Builds the machine-readable report record for one notebook. Duplicates
+    (status "duplicate") name the notebook whose Markdown they received.
+    """
+    stats = stats or {}
     return {
-        "total_cells": total_cells,
-        "cells_with_outputs": cells_with_outputs,
-        "output_path": str(output_file),
+        "type": "notebook",
+        "path": str(notebook_path),
+        "status": status or ("error" if error else "ok"),
+        "error": type(error).__name__ if error else None,
+        "duplicate_of": str(duplicate_of) if duplicate_of else None,
+        "output_path": stats.get("output_path"),
+        "duration_seconds": round(duration, 6),
+        "load_seconds": round(stats.get("load_seconds", 0.0), 6),
+        "render_seconds": round(stats.get("render_seconds", 0.0), 6),
+        "bytes_in": stats.get("bytes_in", 0),
+        "bytes_out": stats.get("bytes_out", 0),
+        "cells": stats.get("total_cells", 0),
+        "cells_with_outputs": stats.get("cells_with_outputs", 0),
+        "outputs": stats.get("total_outputs", 0),
     }
 
 
+def summarize_records(records, duration):
+    """Aggregates per-notebook report records into a run summary record."""
+    errors = {}
+    for record in records:
+        if record["error"]:
+            errors[record["error"]] = errors.get(record["error"], 0) + 1
+
+    statuses = [record["status"] for record in records]
+    duplicates = statuses.count("duplicate")
+    converted = statuses.count("ok")
+    return {
+        "type": "summary",
+        "notebooks": len(records),
+        "succeeded": converted + duplicates,
+        "failed": statuses.count("error"),
+        "skipped": statuses.count("skipped"),
+        "duplicates": duplicates,
+        # Share of the delivered notebooks that did not need a conversion
+        "dedup_ratio": round(duplicates / (converted + duplicates), 6) if duplicates else 0.0,
+        "errors": errors,
+        "duration_seconds": round(duration, 6),
+        "bytes_in": sum(record["bytes_in"] for record in records),
+        "bytes_out": sum(record["bytes_out"] for record in records),
+        "cells": sum(record["cells"] for record in records),
+        "outputs": sum(record["outputs"] for record in records),
+    }
+
+
+def format_prometheus(summary, timestamp=None):
+    """Renders a run summary in the Prometheus text exposition format."""
+    timestamp = time.time() if timestamp is None else timestamp
+    lines = [
+        "# HELP jmd_last_run_notebooks Notebooks processed in the last run, by status.",
+        "# TYPE jmd_last_run_notebooks gauge",
+        f'jmd_last_run_notebooks{{status="ok"}} {summary["succeeded"] - summary["duplicates"]}',
+        f'jmd_last_run_notebooks{{status="duplicate"}} {summary["duplicates"]}',
+        f'jmd_last_run_notebooks{{status="error"}} {summary["failed"]}',
+        f'jmd_last_run_notebooks{{status="skipped"}} {summary["skipped"]}',
+        "# HELP jmd_dedup_ratio Share of delivered notebooks copied from an identical one.",
+        "# TYPE jmd_dedup_ratio gauge",
+        f"jmd_dedup_ratio {summary['dedup_ratio']}",
+        "# HELP jmd_last_run_errors Failed notebooks in the last run, by error class.",
+        "# TYPE jmd_last_run_errors gauge",
+    ]
+    for error_class, count in sorted(summary["errors"].items()):
+        lines.append(f'jmd_last_run_errors{{error="{error_class}"}} {count}')
+    lines += [
+        "# HELP jmd_read_bytes Notebook bytes read in the last run.",
+        "# TYPE jmd_read_bytes gauge",
+        f"jmd_read_bytes {summary['bytes_in']}",
+        "# HELP jmd_written_bytes Markdown bytes written in the last run.",
+        "# TYPE jmd_written_bytes gauge",
+        f"jmd_written_bytes {summary['bytes_out']}",
+        "# HELP jmd_cells Cells converted in the last run.",
+        "# TYPE jmd_cells gauge",
+        f"jmd_cells {summary['cells']}",
+        "# HELP jmd_outputs Outputs converted in the last run.",
+        "# TYPE jmd_outputs gauge",
+        f"jmd_outputs {summary['outputs']}",
+        "# HELP jmd_run_duration_seconds Wall time of the last run.",
+        "# TYPE jmd_run_duration_seconds gauge",
+        f"jmd_run_duration_seconds {summary['duration_seconds']}",
+        "# HELP jmd_last_run_timestamp_seconds Unix time the last run finished.",
+        "# TYPE jmd_last_run_timestamp_seconds gauge",
+        f"jmd_last_run_timestamp_seconds {timestamp:.3f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_textfile(path, summary):
+    """
+    Writes the run metrics for the node-exporter textfile collector. The file
+    is written next to its destination and renamed into place so the
+    collector never reads a partial file.
+    """
+    metrics_file = Path(path)
+    metrics_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = metrics_file.with_name(f".{metrics_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(format_prometheus(summary), encoding="utf-8")
+    os.replace(tmp_file, metrics_file)
+
+
+def print_stats(stats):
+    """Prints the human-readable summary of a successful conversion."""
+    code_only_cells = stats["total_cells"] - stats["cells_with_outputs"]
+    print(f"[OK] Conversion successful!")
+    print(f"  - Total cells processed: {stats['total_cells']}")
+    print(f"  - Cells with outputs:  {stats['cells_with_outputs']}")
+    print(f"  - Code-only cells:     {code_only_cells}")
+    print(f"[OK] Output saved to: {stats['output_path']}")
+
+
+SUBCOMMANDS = {"diff": diff_main, "search": search_main}
+
+
 def main():
     """CLI entry point."""
+    try:
+        run()
+    except BrokenPipeError:
+        # The reader of stdout went away (e.g. `jmd big.ipynb -o - | head`).
+        # Stop quietly like a Unix filter killed by SIGPIPE, and point stdout
+        # at devnull so the interpreter's final flush doesn't fail again.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(141)
+
+
+def run():
+    """Parses the command line and converts the notebooks it names."""
+    if sys.argv[1:2] and sys.argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+
+    # Fast path for the most common call, `jmd notebook.ipynb` (e.g. from an
+    # editor save hook): building the argument parser costs more than
+    # converting a small notebook, so it is skipped when there are no options.
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".ipynb") and not sys.argv[1].startswith("-"):
+        try:
+            stats = convert_notebook(sys.argv[1])
+        except Exception as e:
+            print(error_message(sys.argv[1], e), file=sys.stderr)
+            sys.exit(1)
+        else:
+            print_stats(stats)
+        return
+
+    from argparse import ArgumentParser
+
     parser = ArgumentParser(
         description="Convert Jupyter notebooks to complete markdown without dropping cells."
     )
-    parser.add_argument("notebook_path", help="Path to the input .ipynb notebook file.")
+    parser.add_argument(
+        "notebook_path", nargs="+", help="Path(s) to the input .ipynb notebook file(s)."
+    )
     parser.add_argument(
         "-o",
         "--output",
         help="Path for the output .md file. If not provided, it will be saved next to the notebook.",
     )
+    parser.add_argument(
+        "--report",
+        choices=["text", "jsonl"],
+        default="text",
+        help="Report format. 'jsonl' prints one JSON record per notebook plus a summary record.",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Write run metrics to this Prometheus node-exporter textfile (*.prom).",
+    )
+
+    parser.add_argument(
+        "--framing",
+        choices=sorted(FRAME_DELIMITERS),
+        help="Read a stream of NUL- or newline-delimited notebooks from stdin ('-') "
+        "and write their Markdown documents to stdout, each terminated by a NUL byte.",
+    )
+    parser.add_argument(
+        "--max-table-rows",
+        type=int,
+        default=MAX_TABLE_ROWS,
+        help=f"Maximum rows of an HTML table (e.g. a DataFrame) to render (default: {MAX_TABLE_ROWS}).",
+    )
+    parser.add_argument(
+        "--max-table-cols",
+        type=int,
+        default=MAX_TABLE_COLS,
+        help=f"Maximum columns of an HTML table to render (default: {MAX_TABLE_COLS}).",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Append completed notebooks to this journal and skip those already in it, "
+        "so an interrupted batch resumes where it stopped.",
+    )
+    parser.add_argument(
+        "--queue",
+        help="Directory of lock files shared by several jmd workers draining the same "
+        "notebooks; each notebook is converted by one worker only.",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=600,
+        help="Seconds after which a queue lock is considered abandoned (default: 600).",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_MODES,
+        help="Convert identical notebooks once and give the others the same Markdown. "
+        "'content' matches identical files; 'source' also matches notebooks whose "
+        "outputs or execution counts differ (they get the first notebook's outputs).",
+    )
+    parser.add_argument(
+        "--dedup-link",
+        choices=["hardlink", "copy"],
+        default="hardlink",
+        help="How duplicates receive their Markdown (default: hardlink, "
+        "falling back to a copy across filesystems).",
+    )
+    parser.add_argument(
+        "--cells",
+        type=parse_cell_ranges,
+        help="Only convert these cell numbers, e.g. '10-200' or '1-5,9,40-'.",
+    )
+    parser.add_argument(
+        "--tags",
+        help="Only convert cells carrying at least one of these comma-separated tags.",
+    )
+    parser.add_argument(
+        "--types",
+        help="Only convert these comma-separated cell types (code, markdown, raw).",
+    )
+    parser.add_argument(
+        "--no-outputs",
+        action="store_true",
+        help="Leave cell outputs out of the Markdown.",
+    )
+    parser.add_argument(
+        "--stream-threshold",
+        type=int,
+        default=STREAM_THRESHOLD >> 20,
+        metavar="MIB",
+        help="With --cells/--tags/--types/--no-outputs, stream notebooks of at least this "
+        "many MiB from disk, skipping unselected cells and outputs unparsed, instead of "
+        f"loading them (default: {STREAM_THRESHOLD >> 20}).",
+    )
+    parser.add_argument(
+        "--index",
+        help="Add the converted cells to this SQLite full-text index, for `jmd search`.",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_DEFAULT_SUFFIX),
+        help="Compress the Markdown output (default output name gets .md.gz/.md.xz/.md.bz2). "
+        "Outputs named *.gz, *.xz or *.bz2 are compressed automatically.",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="Compression level (gzip: 0-9, bz2: 1-9, default 9; xz preset: 0-9, default 6).",
+    )
 
     args = parser.parse_args()
+    if args.max_table_rows < 1 or args.max_table_cols < 1:
+        parser.error("--max-table-rows and --max-table-cols must be at least 1")
+    if args.output and len(args.notebook_path) > 1:
+        parser.error("-o/--output can only be used with a single notebook")
+    if args.framing and (
+        args.notebook_path != [STDIO_PATH] or args.output not in (None, STDIO_PATH)
+    ):
+        parser.error("--framing reads from stdin ('-') and writes to stdout")
+    if not 0 < args.lease < float("inf"):
+        parser.error("--lease must be a positive number of seconds")
+    if (args.journal or args.queue) and (args.framing or STDIO_PATH in args.notebook_path):
+        parser.error("--journal and --queue only work with notebook files")
+    if args.index and (args.framing or STDIO_PATH in args.notebook_path):
+        parser.error("--index only works with notebook files")
+    if args.index and (args.cells or args.tags or args.types or args.no_outputs):
+        parser.error("--index indexes whole notebooks; drop --cells/--tags/--types/--no-outputs")
+    writes_stdout = args.output == STDIO_PATH or (
+        not args.output and STDIO_PATH in args.notebook_path
+    )
+    if args.compress and (writes_stdout or args.framing):
+        parser.error("--compress writes files, not stdout")
+    suffix_codec = args.output and COMPRESSION_SUFFIXES.get(Path(args.output).suffix)
+    if args.compress and args.output and suffix_codec != args.compress:
+        parser.error(
+            f"--compress {args.compress} needs an output name ending in "
+            f"{COMPRESSION_DEFAULT_SUFFIX[args.compress]}, not '{args.output}'"
+        )
+    codec = args.compress or suffix_codec
+    if codec == "bz2" and args.compress_level == 0:
+        parser.error("bz2 compression levels are 1-9")
+    if args.dedup and (args.output or args.framing or STDIO_PATH in args.notebook_path):
+        parser.error("--dedup only works with notebook files converted next to themselves")
+    if args.dedup and args.index:
+        parser.error("--dedup cannot be combined with --index")
 
-    try:
-        stats = convert_notebook(args.notebook_path, args.output)
-        code_only_cells = stats["total_cells"] - stats["cells_with_outputs"]
-        print(f"[OK] Conversion successful!")
-        print(f"  - Total cells processed: {stats['total_cells']}")
-        print(f"  - Cells with outputs:  {stats['cells_with_outputs']}")
-        print(f"  - Code-only cells:     {code_only_cells}")
-        print(f"[OK] Output saved to: {stats['output_path']}")
-    except FileNotFoundError:
-        print(
-            f"[ERROR] Error: Input file not found at '{args.notebook_path}'",
-            file=sys.stderr,
+    journal = Journal(args.journal) if args.journal else None
+    queue = WorkQueue(args.queue, args.lease) if args.queue else None
+    index = SearchIndex(args.index) if args.index else None
+
+    options = {
+        "max_table_rows": args.max_table_rows,
+        "max_table_cols": args.max_table_cols,
+        "selection": Selection(
+            ranges=args.cells or (),
+            tags=args.tags.split(",") if args.tags else (),
+            types=args.types.split(",") if args.types else (),
+            outputs=not args.no_outputs,
+        ),
+    }
+
+    if args.framing:
+        out = Utf8Writer(sys.stdout.buffer)
+        frames = iter_frames(sys.stdin.buffer, FRAME_DELIMITERS[args.framing])
+        jobs = (
+            (f"<stdin>#{n}", lambda frame=frame: convert_frame(frame, out, **options))
+            for n, frame in enumerate(frames, 1)
         )
-        sys.exit(1)
-    except json.JSONDecodeError:
-        print(
-            f"[ERROR] Error: Could not parse the notebook file. It might be corrupted.",
-            file=sys.stderr,
+    else:
+        file_options = {
+            "index": index,
+            "compression": args.compress,
+            "compress_level": args.compress_level,
+            "stream_threshold": args.stream_threshold << 20,
+        }
+        jobs = (
+            (path, lambda path=path: convert_notebook(path, args.output, **file_options, **options))
+            for path in args.notebook_path
         )
-        sys.exit(1)
-    except Exception as e:
-        print(f"[ERROR] An unexpected error occurred: {e}", file=sys.stderr)
+
+    # Keep stdout clean for Markdown when it is part of a pipeline
+    status = redirect_stdout(sys.stderr) if writes_stdout else nullcontext()
+
+    records = []
+    run_started = time.perf_counter()
+    # Dedup key -> (notebook, stats) of the first notebook converted with it
+    converted = {}
+
+    for notebook_path, convert in jobs:
+        if journal and journal.is_done(notebook_path):
+            skip_reason = "already converted"
+        elif queue and not queue.claim(notebook_path):
+            skip_reason = "done or claimed by another worker"
+        else:
+            skip_reason = None
+
+        if skip_reason:
+            record = notebook_record(notebook_path, status="skipped")
+            records.append(record)
+            with status:
+                if args.report == "jsonl":
+                    print(json.dumps(record), flush=True)
+                else:
+                    print(f"[SKIP] {notebook_path}: {skip_reason}")
+            continue
+
+        started = time.perf_counter()
+        dedup_key = (
+            notebook_hash(notebook_path, args.dedup, args.stream_threshold << 20)
+            if args.dedup
+            else None
+        )
+        original = converted.get(dedup_key) if dedup_key else None
+        stats, error = None, None
+        try:
+            if original:
+                stats = dict(original[1], load_seconds=0.0, render_seconds=0.0)
+                stats["output_path"] = str(markdown_path(notebook_path, args.compress))
+                stats["bytes_in"] = Path(notebook_path).stat().st_size
+                fan_out(original[1]["output_path"], stats["output_path"], args.dedup_link)
+            else:
+                stats = convert()
+        except BrokenPipeError:
+            raise  # the reader of stdout is gone; see main()
+        except Exception as e:
+            error = e
+            print(error_message(notebook_path, e), file=sys.stderr)
+        if dedup_key and stats and not original:
+            converted[dedup_key] = (notebook_path, stats)
+
+        if journal and stats:
+            journal.record(notebook_path, stats)
+        if queue:
+            if stats:
+                queue.complete(notebook_path)
+            else:
+                queue.release(notebook_path)
+
+        duration = time.perf_counter() - started
+        if original and stats:
+            record = notebook_record(
+                notebook_path, stats, duration=duration, status="duplicate", duplicate_of=original[0]
+            )
+        else:
+            record = notebook_record(notebook_path, stats, error, duration)
+        records.append(record)
+        with status:
+            if args.report == "jsonl":
+                print(json.dumps(record), flush=True)
+            elif original and stats:
+                print(f"[OK] Duplicate of {original[0]}, output saved to: {stats['output_path']}")
+            elif stats:
+                print_stats(stats)
+
+    summary = summarize_records(records, time.perf_counter() - run_started)
+
+    with status:
+        if args.report == "jsonl":
+            print(json.dumps(summary))
+        elif len(records) > 1:
+            labels = {"skipped": "skipped", "duplicates": "deduplicated"}
+            notes = [f"{summary[key]} {label}" for key, label in labels.items() if summary[key]]
+            notes = f" ({', '.join(notes)})" if notes else ""
+            print(f"[OK] Converted {summary['succeeded']}/{summary['notebooks']} notebooks{notes}")
+
+    if index:
+        index.close()
+
+    if args.metrics_textfile:
+        write_metrics_textfile(args.metrics_textfile, summary)
+
+    if summary["failed"]:
         sys.exit(1)
 
 
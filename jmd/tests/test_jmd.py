@@ -1,11 +1,23 @@
+import bz2
+import gzip
+import io
+import lzma
 import sys
+import time
 import pytest
 import json
 import subprocess
+from argparse import ArgumentTypeError
 from pathlib import Path
 
 # Make the script's functions available for testing
 from jmd import format_markdown_cell, format_code_cell, format_output, convert_notebook
+from jmd import write_markdown, iter_frames
+from jmd import Cell, Output, loads_notebook, html_table_to_markdown
+from jmd import Journal, WorkQueue, notebook_hash
+from jmd import SearchIndex, align_keys, diff_cells
+from jmd import JsonScanner, Selection, StreamingNotebook, parse_cell_ranges, write_cells
+from jmd import STREAM_THRESHOLD
 
 # --- Test Data Fixtures ---
 
@@ -250,3 +262,949 @@ def test_main_function_file_not_found(mocker):
         file=sys.stderr,
     )
     mock_exit.assert_called_once_with(1)
+
+
+# --- Run Report Tests ---
+
+
+def test_cli_jsonl_report(tmp_path):
+    good = tmp_path / "good.ipynb"
+    good.write_text(
+        json.dumps(
+            {
+                "cells": [
+                    {
+                        "cell_type": "code",
+                        "execution_count": 1,
+                        "source": ["print(1)"],
+                        "outputs": [
+                            {"output_type": "stream", "name": "stdout", "text": ["1\n"]}
+                        ],
+                    }
+                ],
+                "nbformat": 4,
+                "nbformat_minor": 2,
+            }
+        )
+    )
+    bad = tmp_path / "bad.ipynb"
+    bad.write_text("this is not json")
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", str(good), str(bad), "--report", "jsonl"],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [r["type"] for r in records] == ["notebook", "notebook", "summary"]
+    assert records[0]["status"] == "ok"
+    assert records[0]["cells"] == 1
+    assert records[0]["outputs"] == 1
+    assert records[0]["bytes_out"] > 0
+    assert records[1]["status"] == "error"
+    assert records[1]["error"] == "JSONDecodeError"
+    assert records[2]["succeeded"] == 1
+    assert records[2]["failed"] == 1
+    assert records[2]["errors"] == {"JSONDecodeError": 1}
+
+
+def test_cli_metrics_textfile(tmp_path):
+    notebook_path = tmp_path / "test.ipynb"
+    notebook_path.write_text('{"cells": [], "nbformat": 4, "nbformat_minor": 2}')
+    metrics_path = tmp_path / "metrics" / "jmd.prom"
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", str(notebook_path), "--metrics-textfile", str(metrics_path)],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0
+    metrics = metrics_path.read_text()
+    assert 'jmd_last_run_notebooks{status="ok"} 1' in metrics
+    assert 'jmd_last_run_notebooks{status="error"} 0' in metrics
+    assert "# TYPE jmd_read_bytes gauge" in metrics
+    assert list(metrics_path.parent.iterdir()) == [metrics_path]
+
+
+# --- Pipeline Mode Tests ---
+
+
+def test_cli_stdin_to_stdout():
+    notebook = {
+        "cells": [{"cell_type": "markdown", "source": ["Piped cell"]}],
+        "nbformat": 4,
+        "nbformat_minor": 2,
+    }
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "-"],
+        input=json.dumps(notebook),
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0
+    assert result.stdout.startswith("## Cell 1 (markdown)")
+    assert "Piped cell" in result.stdout
+    assert "[OK] Conversion successful!" in result.stderr
+
+
+def test_cli_file_to_stdout(tmp_path):
+    notebook_path = tmp_path / "test.ipynb"
+    notebook_path.write_text(
+        json.dumps({"cells": [{"cell_type": "markdown", "source": ["Hi"]}]})
+    )
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", str(notebook_path), "-o", "-"],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0
+    assert result.stdout == "## Cell 1 (markdown)\n\nHi\n\n---\n"
+    assert not (tmp_path / "test.md").exists()
+
+
+def test_cli_closed_stdout_exits_quietly(tmp_path):
+    notebook_path = tmp_path / "big.ipynb"
+    cells = [{"cell_type": "markdown", "source": ["word " * 200]} for _ in range(2000)]
+    notebook_path.write_text(json.dumps({"cells": cells}))
+
+    process = subprocess.Popen(
+        [sys.executable, "jmd.py", str(notebook_path), "-o", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    process.stdout.read(10)  # like `| head -c 10`
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.wait()
+
+    assert process.returncode == 141
+    assert stderr == b""
+
+
+class TrickleReader:
+    """Binary stream returning at most `size` bytes per read, like a slow pipe."""
+
+    def __init__(self, data, size):
+        self.stream = io.BytesIO(data)
+        self.size = size
+
+    def read(self, n):
+        return self.stream.read(min(n, self.size))
+
+
+@pytest.mark.parametrize("size", [1, 3, 1 << 16])
+def test_iter_frames_across_reads(size):
+    data = b"{}\0\0 \0first frame\0second\0tail"
+    frames = list(iter_frames(TrickleReader(data, size), b"\0"))
+    assert frames == [b"{}", b"first frame", b"second", b"tail"]
+
+
+def test_iter_frames_is_linear_in_frame_size():
+    data = b"x" * (32 << 20) + b"\n{}"
+    started = time.perf_counter()
+    frames = list(iter_frames(io.BufferedReader(io.BytesIO(data)), b"\n"))
+    # Rescanning the pending frame on every read took seconds here
+    assert time.perf_counter() - started < 1.0
+    assert [len(frame) for frame in frames] == [32 << 20, 2]
+
+
+@pytest.mark.parametrize("framing, delimiter", [("nul", "\0"), ("newline", "\n")])
+def test_cli_framed_stream(framing, delimiter):
+    notebooks = [
+        {"cells": [{"cell_type": "markdown", "source": [f"Notebook {i}"]}]}
+        for i in range(3)
+    ]
+    stream = delimiter.join(json.dumps(nb) for nb in notebooks[:2])
+    stream += delimiter + "not json" + delimiter + json.dumps(notebooks[2]) + delimiter
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "-", "--framing", framing, "--report", "jsonl"],
+        input=stream,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    documents = result.stdout.split("\0")
+    assert documents[-1] == ""
+    assert len(documents) == 5
+    assert "Notebook 0" in documents[0]
+    assert "Notebook 1" in documents[1]
+    assert documents[2] == ""
+    assert "Notebook 2" in documents[3]
+    summary = json.loads(result.stderr.strip().splitlines()[-1])
+    assert summary["succeeded"] == 3
+    assert summary["failed"] == 1
+
+
+# --- Cell/Output Model Tests ---
+
+
+def test_loads_notebook_builds_model():
+    nb = loads_notebook(
+        json.dumps(
+            {
+                "cells": [
+                    {
+                        "cell_type": "code",
+                        "execution_count": 1,
+                        "metadata": {"tags": ["setup"]},
+                        "source": ["x = 1\n", "print(x)"],
+                        "outputs": [
+                            {
+                                "output_type": "display_data",
+                                "data": {"image/png": "iVBORw0KGgo=", "text/plain": ["<Figure>"]},
+                                "metadata": {},
+                            }
+                        ],
+                    }
+                ],
+                "metadata": {"kernelspec": {"name": "python3"}},
+                "nbformat": 4,
+            }
+        )
+    )
+
+    cell = nb["cells"][0]
+    assert isinstance(cell, Cell)
+    assert cell.source == ["x = 1\n", "print(x)"]  # kept as parsed
+    assert cell.length == len("x = 1\nprint(x)")
+    assert cell.tags == ("setup",)
+    assert isinstance(cell.outputs[0], Output)
+    assert cell.outputs[0].data == {"text/plain": ["<Figure>"]}
+    assert nb["metadata"] == {"kernelspec": {"name": "python3"}}
+
+
+def test_model_digest_ignores_source_splitting():
+    split = Cell("code", ["a = 1\n", "b = 2"])
+    joined = Cell("code", "a = 1\nb = 2")
+    other = Cell("markdown", "a = 1\nb = 2")
+
+    assert split.digest == joined.digest
+    assert split.digest != other.digest
+    assert Output("stream", "stdout", ["hi\n"]).digest == Output("stream", "stdout", "hi\n").digest
+
+
+def test_formatters_accept_model_objects():
+    cell = Cell("code", ["print('hi')"], 3, [Output("stream", "stdout", ["hi\n"])])
+
+    assert "## Cell 1 (code) [3]" in format_code_cell(cell, 1)
+    assert "hi" in format_output(cell.outputs[0])
+
+
+# --- HTML Table Tests ---
+
+
+DATAFRAME_HTML = (
+    '<div><style scoped>.dataframe td { vertical-align: top; }</style>'
+    '<table border="1" class="dataframe"><thead><tr style="text-align: right;">'
+    "<th></th><th>name</th><th>a|b</th></tr></thead><tbody>"
+    "<tr><th>0</th><td>x &amp; y</td><td>1</td></tr>"
+    "<tr><th>1</th><td>z</td><td>2</td></tr>"
+    "</tbody></table><p>2 rows × 2 columns</p></div>"
+)
+
+
+def test_html_table_to_markdown():
+    result = html_table_to_markdown(DATAFRAME_HTML)
+    assert result.splitlines() == [
+        "|  | name | a\\|b |",
+        "|---|---|---|",
+        "| 0 | x & y | 1 |",
+        "| 1 | z | 2 |",
+    ]
+
+
+def test_html_table_to_markdown_caps_rows_and_columns():
+    rows = "".join(f"<tr><td>{i}</td><td>a</td><td>b</td></tr>" for i in range(1000))
+    html = f"<table><tr><th>i</th><th>x</th><th>y</th></tr>{rows}</table>"
+
+    result = html_table_to_markdown(html, max_rows=5, max_cols=2)
+
+    lines = result.splitlines()
+    assert lines[0] == "| i | x |"
+    assert lines[6] == "| 4 | a |"
+    assert lines[-1] == "*(showing 5 of 1000 rows, 2 of 3 columns)*"
+
+
+# pandas writes a second header row when the index is named (e.g. groupby results)
+NAMED_INDEX_HTML = (
+    '<table border="1" class="dataframe"><thead>'
+    '<tr style="text-align: right;"><th></th><th>v</th></tr>'
+    "<tr><th>k</th><th></th></tr>"
+    "</thead><tbody>"
+    + "".join(f"<tr><th>{k}</th><td>{i}</td></tr>" for i, k in enumerate("abcd"))
+    + "</tbody></table>"
+)
+
+
+def test_html_table_to_markdown_named_index():
+    assert html_table_to_markdown(NAMED_INDEX_HTML).splitlines()[:3] == [
+        "| k | v |",
+        "|---|---|",
+        "| a | 0 |",
+    ]
+
+    lines = html_table_to_markdown(NAMED_INDEX_HTML, max_rows=2).splitlines()
+    assert lines[2:4] == ["| a | 0 |", "| b | 1 |"]
+    assert lines[-1] == "*(showing 2 of 4 rows, 2 of 2 columns)*"
+
+
+# pandas 3.0 `_repr_html_()` of df.groupby(["k1", "k2"]).sum()
+GROUPBY_HTML = """<table border="1" class="dataframe">
+  <thead>
+    <tr style="text-align: right;">
+      <th></th>
+      <th></th>
+      <th>v</th>
+    </tr>
+    <tr>
+      <th>k1</th>
+      <th>k2</th>
+      <th></th>
+    </tr>
+  </thead>
+  <tbody>
+    <tr>
+      <th rowspan="2" valign="top">a</th>
+      <th>x</th>
+      <td>1</td>
+    </tr>
+    <tr>
+      <th>y</th>
+      <td>2</td>
+    </tr>
+    <tr>
+      <th>b</th>
+      <th>x</th>
+      <td>3</td>
+    </tr>
+  </tbody>
+</table>"""
+
+# ... and of a frame with MultiIndex columns ("A", "x"), ("A", "y"), ("B", "z")
+MULTI_COLUMNS_HTML = """<table border="1" class="dataframe">
+  <thead>
+    <tr>
+      <th></th>
+      <th colspan="2" halign="left">A</th>
+      <th>B</th>
+    </tr>
+    <tr>
+      <th></th>
+      <th>x</th>
+      <th>y</th>
+      <th>z</th>
+    </tr>
+  </thead>
+  <tbody>
+    <tr>
+      <th>0</th>
+      <td>1</td>
+      <td>2</td>
+      <td>3</td>
+    </tr>
+    <tr>
+      <th>1</th>
+      <td>4</td>
+      <td>5</td>
+      <td>6</td>
+    </tr>
+  </tbody>
+</table>"""
+
+
+def test_html_table_to_markdown_repeats_rowspan():
+    assert html_table_to_markdown(GROUPBY_HTML).splitlines() == [
+        "| k1 | k2 | v |",
+        "|---|---|---|",
+        "| a | x | 1 |",
+        "| a | y | 2 |",
+        "| b | x | 3 |",
+    ]
+
+    lines = html_table_to_markdown(GROUPBY_HTML, max_rows=2, max_cols=2).splitlines()
+    assert lines[2:4] == ["| a | x |", "| a | y |"]
+    assert lines[-1] == "*(showing 2 of 3 rows, 2 of 3 columns)*"
+
+
+def test_html_table_to_markdown_expands_colspan():
+    assert html_table_to_markdown(MULTI_COLUMNS_HTML).splitlines() == [
+        "|  | A x | A y | B z |",
+        "|---|---|---|---|",
+        "| 0 | 1 | 2 | 3 |",
+        "| 1 | 4 | 5 | 6 |",
+    ]
+
+@pytest.mark.parametrize("flag", ["--max-table-rows", "--max-table-cols"])
+def test_cli_rejects_table_caps_below_one(flag):
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "-", flag, "-1"], input="{}", capture_output=True, text=True
+    )
+    assert result.returncode == 2
+    assert "must be at least 1" in result.stderr
+
+def test_format_output_dataframe_uses_table():
+    output = {
+        "output_type": "execute_result",
+        "data": {"text/html": [DATAFRAME_HTML], "text/plain": ["  name  a|b\n0 ..."]},
+    }
+    result = format_output(output)
+    assert result.startswith("**Result:**\n|  | name |")
+    assert "```text" not in result
+
+
+def test_format_output_html_without_table_falls_back_to_plain():
+    output = {
+        "output_type": "display_data",
+        "data": {"text/html": ["<b>bold</b>"], "text/plain": ["<IPython.HTML>"]},
+    }
+    result = format_output(output)
+    assert "```text\n<IPython.HTML>\n```" in result
+
+
+# --- Resumable Batch Tests ---
+
+
+def write_notebooks(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f"nb{i}.ipynb"
+        path.write_text(json.dumps({"cells": [{"cell_type": "markdown", "source": [f"{i}"]}]}))
+        paths.append(str(path))
+    return paths
+
+
+def test_cli_journal_resumes(tmp_path):
+    paths = write_notebooks(tmp_path, 3)
+    journal_path = tmp_path / "journal.jsonl"
+    command = [sys.executable, "jmd.py", "--journal", str(journal_path), "--report", "jsonl"]
+
+    first = subprocess.run(command + paths[:2], capture_output=True, text=True)
+    assert first.returncode == 0
+    assert len(journal_path.read_text().splitlines()) == 2
+
+    # Touching a journaled notebook makes it eligible again
+    Path(paths[1]).write_text(json.dumps({"cells": []}))
+    second = subprocess.run(command + paths, capture_output=True, text=True)
+
+    statuses = [json.loads(line)["status"] for line in second.stdout.splitlines()[:-1]]
+    assert statuses == ["skipped", "ok", "ok"]
+    assert len(journal_path.read_text().splitlines()) == 4
+
+
+def test_journal_ignores_torn_line(tmp_path):
+    journal_path = tmp_path / "journal.jsonl"
+    notebook_path = write_notebooks(tmp_path, 1)[0]
+    journal = Journal(journal_path)
+    journal.record(notebook_path, {"output_path": "nb0.md"})
+    with journal_path.open("a") as f:
+        f.write('{"path": "trunc')
+
+    assert Journal(journal_path).is_done(notebook_path)
+
+
+def test_work_queue_claims(tmp_path):
+    notebook_path = write_notebooks(tmp_path, 1)[0]
+    first = WorkQueue(tmp_path / "queue", lease=600)
+    second = WorkQueue(tmp_path / "queue", lease=600)
+    second.owner = "other-worker"
+
+    assert first.claim(notebook_path)
+    assert not second.claim(notebook_path)
+
+    first.release(notebook_path)
+    assert second.claim(notebook_path)
+    second.complete(notebook_path)
+    assert not first.claim(notebook_path)
+
+
+def test_work_queue_takes_over_expired_lease(tmp_path):
+    notebook_path = write_notebooks(tmp_path, 1)[0]
+    dead = WorkQueue(tmp_path / "queue", lease=600)
+    assert dead.claim(notebook_path)
+
+    live = WorkQueue(tmp_path / "queue", lease=-1)
+    assert live.claim(notebook_path)
+
+
+def test_work_queue_reconverts_changed_notebook(tmp_path):
+    notebook_path = write_notebooks(tmp_path, 1)[0]
+    queue = WorkQueue(tmp_path / "queue")
+    assert queue.claim(notebook_path)
+    queue.complete(notebook_path)
+    assert not queue.claim(notebook_path)
+
+    Path(notebook_path).write_text(json.dumps({"cells": []}))
+    assert WorkQueue(tmp_path / "queue").claim(notebook_path)
+
+
+def test_work_queue_renews_held_lease(tmp_path):
+    notebook_path = write_notebooks(tmp_path, 1)[0]
+    slow = WorkQueue(tmp_path / "queue", lease=0.3)
+    assert slow.claim(notebook_path)
+
+    time.sleep(0.6)  # a conversion running longer than the lease
+    assert not WorkQueue(tmp_path / "queue", lease=0.3).claim(notebook_path)
+    slow.release(notebook_path)
+
+
+def test_cli_queue_workers_split_work(tmp_path):
+    paths = write_notebooks(tmp_path, 12)
+    command = [sys.executable, "jmd.py", "--queue", str(tmp_path / "queue"), "--report", "jsonl"]
+
+    workers = [
+        subprocess.Popen(command + paths, stdout=subprocess.PIPE, text=True) for _ in range(3)
+    ]
+    summaries = [json.loads(w.communicate()[0].splitlines()[-1]) for w in workers]
+
+    assert sum(summary["succeeded"] for summary in summaries) == 12
+    assert all(summary["failed"] == 0 for summary in summaries)
+
+
+@pytest.mark.parametrize("lease", ["0", "-5", "nan"])
+def test_cli_queue_rejects_invalid_lease(tmp_path, lease):
+    paths = write_notebooks(tmp_path, 1)
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "--queue", str(tmp_path / "queue"), "--lease", lease] + paths,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 2
+    assert "--lease must be a positive number of seconds" in result.stderr
+    assert not (tmp_path / "nb0.md").exists()
+
+# --- Duplicate Detection Tests ---
+
+
+def code_notebook(source, output, execution_count=1):
+    return {
+        "cells": [
+            {
+                "cell_type": "code",
+                "execution_count": execution_count,
+                "metadata": {},
+                "outputs": [{"output_type": "stream", "name": "stdout", "text": [output]}],
+                "source": [source],
+            }
+        ]
+    }
+
+
+def test_notebook_hash_modes(tmp_path):
+    first, rerun, edited = tmp_path / "a.ipynb", tmp_path / "b.ipynb", tmp_path / "c.ipynb"
+    first.write_text(json.dumps(code_notebook("print(1)", "1\n")))
+    rerun.write_text(json.dumps(code_notebook("print(1)", "one\n", execution_count=7)))
+    edited.write_text(json.dumps(code_notebook("print(2)", "1\n")))
+
+    assert notebook_hash(first) != notebook_hash(rerun)
+    assert notebook_hash(first, "source") == notebook_hash(rerun, "source")
+    assert notebook_hash(first, "source") != notebook_hash(edited, "source")
+    assert notebook_hash(tmp_path / "missing.ipynb") is None
+
+
+@pytest.mark.parametrize("link", ["hardlink", "copy"])
+def test_cli_dedup_converts_once(tmp_path, link):
+    paths = write_notebooks(tmp_path, 2)
+    copies = [tmp_path / "copy0.ipynb", tmp_path / "copy1.ipynb"]
+    for copy in copies:
+        copy.write_bytes(Path(paths[0]).read_bytes())
+    command = [sys.executable, "jmd.py", "--dedup", "content", "--dedup-link", link]
+
+    result = subprocess.run(
+        command + ["--report", "jsonl", paths[0], paths[1]] + [str(c) for c in copies],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    *records, summary = [json.loads(line) for line in result.stdout.splitlines()]
+
+    assert [r["status"] for r in records] == ["ok", "ok", "duplicate", "duplicate"]
+    assert records[2]["duplicate_of"] == paths[0]
+    assert summary["succeeded"] == 4 and summary["duplicates"] == 2
+    assert summary["dedup_ratio"] == 0.5
+    original = tmp_path / "nb0.md"
+    for copy in copies:
+        assert copy.with_suffix(".md").read_text() == original.read_text()
+    assert (original.stat().st_nlink == 3) == (link == "hardlink")
+
+    # Reconverting one notebook must not rewrite its hardlinked siblings
+    Path(paths[0]).write_text(json.dumps({"cells": [{"cell_type": "markdown", "source": ["new"]}]}))
+    subprocess.run([sys.executable, "jmd.py", paths[0]], check=True, capture_output=True)
+    assert "new" in original.read_text()
+    assert "new" not in copies[0].with_suffix(".md").read_text()
+
+
+def test_cli_dedup_by_source(tmp_path):
+    first, rerun = tmp_path / "a.ipynb", tmp_path / "b.ipynb"
+    first.write_text(json.dumps(code_notebook("print(1)", "1\n")))
+    rerun.write_text(json.dumps(code_notebook("print(1)", "1\n", execution_count=9)))
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "--dedup", "source", str(first), str(rerun)],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert f"[OK] Duplicate of {first}" in result.stdout
+    assert "(1 deduplicated)" in result.stdout
+    assert (tmp_path / "b.md").read_text() == (tmp_path / "a.md").read_text()
+
+
+# --- Selective Conversion Tests ---
+
+
+SELECTION_NOTEBOOK = {
+    "cells": [
+        {"cell_type": "markdown", "metadata": {}, "source": ["# Title"]},
+        {
+            "cell_type": "code",
+            "execution_count": 1,
+            "metadata": {"tags": ["setup"]},
+            "outputs": [
+                {"output_type": "stream", "name": "stdout", "text": ["a \\\"quoted\\\" line\n"]},
+                {"output_type": "display_data", "data": {"image/png": "iVBOR" * 200}, "metadata": {}},
+            ],
+            "source": ["import os\n", "print('[{')"],
+        },
+        {"cell_type": "code", "execution_count": 2, "metadata": {}, "outputs": [], "source": "x = 1"},
+        {"cell_type": "raw", "metadata": {}, "source": ["raw"]},
+    ],
+    "metadata": {"language_info": {"name": "python"}},
+    "nbformat": 4,
+    "nbformat_minor": 5,
+}
+
+
+def test_parse_cell_ranges():
+    assert parse_cell_ranges("10-200") == [(10, 200)]
+    assert parse_cell_ranges("1-3,8") == [(1, 3), (8, 8)]
+    assert parse_cell_ranges("-5")[0] == (1, 5)
+    assert parse_cell_ranges("7-")[0][0] == 7
+    with pytest.raises(ArgumentTypeError):
+        parse_cell_ranges("5-2")
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [
+        Selection(ranges=[(1, 100)]),
+        Selection(types=["code"], outputs=False),
+        Selection(tags=["setup"]),
+        Selection(ranges=[(2, 3)], outputs=False),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_streaming_matches_loaded_conversion(monkeypatch, selection, chunk_size):
+    raw = json.dumps(SELECTION_NOTEBOOK, indent=1).encode("utf-8")
+    monkeypatch.setattr(JsonScanner, "CHUNK_SIZE", chunk_size)
+
+    streamed = io.StringIO()
+    notebook = StreamingNotebook(io.BytesIO(raw), selection)
+    write_cells(notebook, streamed, selection.outputs)
+    loaded = io.StringIO()
+    write_markdown(loads_notebook(raw), loaded, selection)
+
+    assert streamed.getvalue() == loaded.getvalue()
+    # Reading stops after the last selected range
+    assert notebook.total_cells == min(4, selection.last)
+
+
+@pytest.mark.parametrize("stream_threshold", [0, STREAM_THRESHOLD])
+def test_selected_total_cells_does_not_depend_on_streaming(tmp_path, stream_threshold):
+    notebook_path = tmp_path / "test.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+
+    stats = convert_notebook(
+        str(notebook_path),
+        str(tmp_path / "test.md"),
+        selection=Selection(ranges=[(1, 2)]),
+        stream_threshold=stream_threshold,
+    )
+    assert stats["total_cells"] == 2
+
+
+def test_streaming_truncated_notebook_raises_decode_error():
+    raw = json.dumps(SELECTION_NOTEBOOK).encode("utf-8")[:-40]
+    with pytest.raises(json.JSONDecodeError):
+        list(StreamingNotebook(io.BytesIO(raw), Selection(outputs=False)))
+
+
+def test_cli_selection(tmp_path):
+    notebook_path = tmp_path / "test.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", str(notebook_path), "-o", "-", "--types", "code", "--no-outputs"],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0
+    assert "# Title" not in result.stdout
+    assert "## Cell 2 (code) [1]" in result.stdout  # outputs skipped, not absent
+    assert "## Cell 3 (code) [no output] [2]" in result.stdout
+    assert "quoted" not in result.stdout
+
+
+# --- Search Index Tests ---
+
+
+def test_search_index_updates_incrementally(tmp_path):
+    notebook_path = tmp_path / "analysis.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+    index = SearchIndex(tmp_path / "index.db")
+
+    convert_notebook(str(notebook_path), index=index)
+    hits = index.search("quoted")
+    assert [(hit["cell"], hit["cell_type"]) for hit in hits] == [(2, "code")]
+    assert hits[0]["markdown_path"] == str(tmp_path / "analysis.md")
+    assert "[quoted]" in hits[0]["snippet"]
+
+    # Unchanged notebooks are not re-indexed
+    assert not index.begin(notebook_path)
+
+    changed = dict(SELECTION_NOTEBOOK, cells=[{"cell_type": "markdown", "source": ["fresh"]}])
+    notebook_path.write_text(json.dumps(changed))
+    convert_notebook(str(notebook_path), index=index)
+    assert index.search("quoted") == []
+    assert [hit["cell"] for hit in index.search("fresh")] == [1]
+    index.close()
+
+
+def test_search_index_rejects_selection(tmp_path):
+    notebook_path = tmp_path / "analysis.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+    index = SearchIndex(tmp_path / "index.db")
+
+    with pytest.raises(ValueError):
+        convert_notebook(str(notebook_path), index=index, selection=Selection(ranges=[(1, 1)]))
+    # The notebook is still due for (full) indexing
+    assert index.begin(notebook_path)
+    index.close()
+
+
+@pytest.mark.parametrize("flag", [["--cells", "1"], ["--types", "code"], ["--no-outputs"]])
+def test_cli_index_rejects_selection(tmp_path, flag):
+    notebook_path = tmp_path / "analysis.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", str(notebook_path), "--index", str(tmp_path / "index.db")] + flag,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 2
+    assert "--index indexes whole notebooks" in result.stderr
+    assert not (tmp_path / "index.db").exists()
+
+def test_cli_index_and_search(tmp_path):
+    notebook_path = tmp_path / "analysis.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+    index_path = tmp_path / "index.db"
+
+    convert = subprocess.run(
+        [sys.executable, "jmd.py", str(notebook_path), "--index", str(index_path)],
+        capture_output=True,
+        text=True,
+    )
+    assert convert.returncode == 0
+
+    search = subprocess.run(
+        [sys.executable, "jmd.py", "search", str(index_path), "import"],
+        capture_output=True,
+        text=True,
+    )
+    assert search.returncode == 0
+    assert search.stdout.startswith(f"{tmp_path / 'analysis.md'} (Cell 2, code): [import] os")
+
+    missing = subprocess.run(
+        [sys.executable, "jmd.py", "search", str(index_path), "nonexistentword"],
+        capture_output=True,
+        text=True,
+    )
+    assert missing.returncode == 1
+
+
+# --- Compressed Output Tests ---
+
+
+@pytest.mark.parametrize("suffix, codec", [(".gz", gzip), (".xz", lzma), (".bz2", bz2)])
+def test_convert_notebook_compressed_by_suffix(tmp_path, suffix, codec):
+    notebook_path = tmp_path / "test.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+    output_path = tmp_path / f"test.md{suffix}"
+
+    stats = convert_notebook(str(notebook_path), str(output_path))
+
+    markdown = codec.open(output_path, "rt", encoding="utf-8").read()
+    assert markdown.startswith("## Cell 1 (markdown)")
+    assert stats["bytes_out"] == output_path.stat().st_size
+
+
+def test_cli_compress_flag(tmp_path):
+    notebook_path = tmp_path / "test.ipynb"
+    notebook_path.write_text(json.dumps(SELECTION_NOTEBOOK))
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", str(notebook_path), "--compress", "gzip", "--compress-level", "1"],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0
+    assert not (tmp_path / "test.md").exists()
+    with gzip.open(tmp_path / "test.md.gz", "rt", encoding="utf-8") as f:
+        assert "## Cell 2 (code) [1]" in f.read()
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["test.ipynb", "--compress", "bz2", "--compress-level", "0"], "levels are 1-9"),
+        (["test.ipynb", "-o", "out.md.bz2", "--compress-level", "0"], "levels are 1-9"),
+        (["-", "--compress", "gzip"], "--compress writes files, not stdout"),
+        (["test.ipynb", "--compress", "gzip", "-o", "out.md.xz"], "ending in .gz, not 'out.md.xz'"),
+        (["test.ipynb", "--compress", "xz", "-o", "out.md"], "ending in .xz, not 'out.md'"),
+    ],
+)
+def test_cli_compress_rejects_invalid_combinations(args, message):
+    result = subprocess.run(
+        [sys.executable, "jmd.py"] + args,
+        input=json.dumps(SELECTION_NOTEBOOK),
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 2
+    assert message in result.stderr
+
+
+# --- Notebook Diff Tests ---
+
+
+def code_cell(source, output=None):
+    outputs = [{"output_type": "stream", "name": "stdout", "text": [output]}] if output else []
+    return {"cell_type": "code", "execution_count": 1, "metadata": {}, "outputs": outputs, "source": [source]}
+
+
+DIFF_OLD = {
+    "cells": [
+        {"cell_type": "markdown", "metadata": {}, "source": ["# Title"]},
+        code_cell("a = 1\nb = 2\nc = 3", "x"),
+        code_cell("print(b)", "2"),
+        code_cell("gone()"),
+    ]
+}
+DIFF_NEW = {
+    "cells": [
+        {"cell_type": "markdown", "metadata": {}, "source": ["# Title"]},
+        code_cell("new_cell()"),
+        code_cell("a = 1\nb = 20\nc = 3", "x"),
+        code_cell("print(b)", "20"),
+    ]
+}
+
+
+def test_align_keys_matches_in_order():
+    old = ["a", "b", "c", "d", "b", "e"]
+    new = ["x", "a", "c", "d", "b", "y", "e"]
+
+    matches = align_keys(old, new)
+
+    assert all(old[i] == new[j] for i, j in matches)
+    assert [old[i] for i, _ in matches] == ["a", "c", "d", "b", "e"]
+
+
+def test_diff_cells_statuses():
+    old = list(enumerate(loads_notebook(json.dumps(DIFF_OLD))["cells"], 1))
+    new = list(enumerate(loads_notebook(json.dumps(DIFF_NEW))["cells"], 1))
+
+    entries = diff_cells(old, new)
+    summary = [(status, o and o[0], n and n[0]) for status, o, n in entries]
+    assert summary == [
+        ("added", None, 2),
+        ("changed", 2, 3),
+        ("changed", 3, 4),  # same source, new output
+        ("removed", 4, None),
+    ]
+
+    entries = diff_cells(old, new, outputs=False)
+    assert [status for status, _, _ in entries] == ["added", "changed", "removed"]
+
+
+def test_diff_cells_pairs_edited_long_cell():
+    lines = [f"value_{i} = compute({i})" for i in range(10)]
+    old = [(1, Cell.from_json(code_cell("\n".join(lines))))]
+    lines[4] = "value_4 = compute(40)"
+    new = [(1, Cell.from_json(code_cell("import os"))), (2, Cell.from_json(code_cell("\n".join(lines))))]
+
+    summary = [(status, o and o[0], n and n[0]) for status, o, n in diff_cells(old, new)]
+    assert summary == [("added", None, 1), ("changed", 1, 2)]
+
+
+def test_diff_cells_detects_html_only_change():
+    def table_cell(html):
+        output = {
+            "output_type": "execute_result",
+            "data": {"text/plain": ["<DataFrame>"], "text/html": [html]},
+        }
+        return dict(code_cell("df"), outputs=[output])
+
+    old = [(1, Cell.from_json(table_cell(DATAFRAME_HTML)))]
+    new = [(1, Cell.from_json(table_cell(DATAFRAME_HTML.replace("<td>1</td>", "<td>2</td>"))))]
+
+    assert [status for status, _, _ in diff_cells(old, new)] == ["changed"]
+    assert diff_cells(old, old) == []
+
+def test_cli_diff_ignores_raw_cells(tmp_path):
+    raw_cell = {"cell_type": "raw", "metadata": {}, "source": ["raw v1"]}
+    old = {"cells": [raw_cell, code_cell("x = 1"), dict(raw_cell, source=["gone"])]}
+    new = {"cells": [dict(raw_cell, source=["raw v2"]), code_cell("x = 2")]}
+    old_path, new_path = tmp_path / "old.ipynb", tmp_path / "new.ipynb"
+    old_path.write_text(json.dumps(old))
+    new_path.write_text(json.dumps(new))
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "diff", str(old_path), str(new_path)],
+        capture_output=True,
+        text=True,
+    )
+
+    assert "0 added, 0 removed, 1 changed" in result.stdout
+    assert "## Cell 2 (code) [no output] [1] [changed]" in result.stdout
+    assert "raw v" not in result.stdout and "gone" not in result.stdout
+    assert not [line for line in result.stdout.splitlines() if line.startswith(" [")]
+
+
+def test_cli_diff(tmp_path):
+    old_path, new_path = tmp_path / "old.ipynb", tmp_path / "new.ipynb"
+    old_path.write_text(json.dumps(DIFF_OLD))
+    new_path.write_text(json.dumps(DIFF_NEW))
+
+    result = subprocess.run(
+        [sys.executable, "jmd.py", "diff", str(old_path), str(new_path)],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    assert "1 added, 1 removed, 2 changed" in result.stdout
+    assert "## Cell 3 (code) [1] [changed, was Cell 2]" in result.stdout
+    assert "-b = 2\n+b = 20" in result.stdout
+    assert "## Cell 4 (code) [1] [outputs changed, was Cell 3]" in result.stdout
+    assert "# Title" not in result.stdout
+
+    same = subprocess.run(
+        [sys.executable, "jmd.py", "diff", str(old_path), str(old_path), "--ignore-outputs"],
+        capture_output=True,
+        text=True,
+    )
+    assert same.returncode == 0
@@ -0,0 +1,120 @@
+import os
+import json
+import tracemalloc
+
+import pytest
+
+from jmd import Selection, convert_notebook, loads_notebook, write_markdown
+
+# --- Memory Budgets ---
+#
+# Peak traced memory of a full conversion may not exceed this multiple of the
+# input file size. The budget can be tuned per CI box through the environment.
+MEMORY_MULTIPLE = float(os.environ.get("JMD_MEMORY_MULTIPLE", "8"))
+
+# Rendering a loaded notebook streams fragments to the output file, so the
+# extra memory it needs must not grow with the notebook size.
+RENDER_CEILING = int(os.environ.get("JMD_RENDER_CEILING", str(2 * 1024 * 1024)))
+
+# Selective conversion of a large notebook streams it from disk, so its whole
+# peak must stay under a fixed ceiling however large the input is.
+STREAM_CEILING = int(os.environ.get("JMD_STREAM_CEILING", str(8 * 1024 * 1024)))
+
+
+def generate_notebook(path, n_cells):
+    """Writes a synthetic notebook of `n_cells` mixed cells and returns its size."""
+    cells = []
+    for i in range(n_cells):
+        if i % 4 == 0:
+            cells.append(
+                {
+                    "cell_type": "markdown",
+                    "metadata": {},
+                    "source": [f"# Section {i}\n", "Some explanatory prose.\n" * 3],
+                }
+            )
+        else:
+            cells.append(
+                {
+                    "cell_type": "code",
+                    "execution_count": i,
+                    "metadata": {},
+                    "outputs": [
+                        {
+                            "name": "stdout",
+                            "output_type": "stream",
+                            "text": [f"step {i} line {j}\n" for j in range(20)],
+                        },
+                        {
+                            "output_type": "execute_result",
+                            "execution_count": i,
+                            "data": {"text/plain": [f"{i * 42}"]},
+                            "metadata": {},
+                        },
+                    ],
+                    "source": [f"x_{i} = {i}\n", f"print(x_{i})"],
+                }
+            )
+    notebook = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    path.write_text(json.dumps(notebook, indent=1), encoding="utf-8")
+    return path.stat().st_size
+
+
+def traced_peak(func, *args, **kwargs):
+    """Runs `func` under tracemalloc and returns its peak traced memory in bytes."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+@pytest.mark.parametrize("n_cells", [2000, 8000])
+def test_convert_peak_memory_is_bounded_by_input_size(tmp_path, n_cells):
+    notebook_path = tmp_path / "large.ipynb"
+    input_size = generate_notebook(notebook_path, n_cells)
+
+    peak = traced_peak(convert_notebook, str(notebook_path), str(tmp_path / "large.md"))
+
+    assert peak < MEMORY_MULTIPLE * input_size, (
+        f"peak {peak} bytes exceeds {MEMORY_MULTIPLE}x input ({input_size} bytes)"
+    )
+
+
+@pytest.mark.parametrize("n_cells", [2000, 8000])
+def test_render_memory_has_fixed_ceiling(tmp_path, n_cells):
+    notebook_path = tmp_path / "large.ipynb"
+    generate_notebook(notebook_path, n_cells)
+    nb = loads_notebook(notebook_path.read_text(encoding="utf-8"))
+
+    def render():
+        with (tmp_path / "large.md").open("w", encoding="utf-8") as out:
+            write_markdown(nb, out)
+
+    peak = traced_peak(render)
+
+    assert peak < RENDER_CEILING, f"rendering peaked at {peak} bytes"
+
+
+@pytest.mark.parametrize("n_cells", [1000, 4000])
+@pytest.mark.parametrize(
+    "selection",
+    [Selection(types=["code"], outputs=False), Selection(ranges=[(1, 10**9)])],
+    ids=["code-only", "all-cells"],
+)
+def test_streaming_peak_memory_has_fixed_ceiling(tmp_path, n_cells, selection):
+    notebook_path = tmp_path / "large.ipynb"
+    generate_notebook(notebook_path, n_cells)
+
+    peak = traced_peak(
+        convert_notebook,
+        str(notebook_path),
+        str(tmp_path / "large.md"),
+        selection=selection,
+        stream_threshold=0,  # stream however small the test notebook is
+    )
+
+    assert peak < STREAM_CEILING, f"streaming conversion peaked at {peak} bytes"
+
@@ -0,0 +1,68 @@
+import os
+import random
+import time
+
+from jmd import Cell, Selection, convert_notebook, diff_cells
+from test_memory import generate_notebook
+
+# --- Speed Budgets ---
+#
+# Wall-clock comparisons are noisy on shared CI boxes, so runs are interleaved
+# and the best of each is compared. The slack can be tuned through the
+# environment.
+
+# A selective conversion may take at most this multiple of a full one.
+SELECTIVE_SLOWDOWN = float(os.environ.get("JMD_SELECTIVE_SLOWDOWN", "1.1"))
+
+# Seconds allowed for diffing a stretch of 50 cells rewritten as 50 others.
+DIFF_GAP_SECONDS = float(os.environ.get("JMD_DIFF_GAP_SECONDS", "2"))
+
+
+def best_times(*calls, runs=5):
+    """Runs the calls interleaved and returns the best wall time of each."""
+    timings = [[] for _ in calls]
+    for _ in range(runs):
+        for call, times in zip(calls, timings):
+            started = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - started)
+    return [min(times) for times in timings]
+
+
+def test_selective_conversion_is_not_slower_than_full(tmp_path):
+    notebook_path = tmp_path / "large.ipynb"
+    generate_notebook(notebook_path, 8000)
+    output_path = str(tmp_path / "large.md")
+    selection = Selection(types=["code"], outputs=False)
+
+    full, selective = best_times(
+        lambda: convert_notebook(str(notebook_path), output_path),
+        lambda: convert_notebook(str(notebook_path), output_path, selection=selection),
+    )
+
+    # A streamed small notebook used to take 2-3x as long
+    assert selective <= SELECTIVE_SLOWDOWN * full, f"selective {selective:.3f}s vs full {full:.3f}s"
+
+
+def rewritten_cells(rng, count):
+    """(cell number, Cell) pairs of ~2 KB code cells drawn from a small vocabulary."""
+    words = ["df", "x", "y", "=", "+", "np.array(", ")", "for", "in", "range(", "if", "return"]
+    cells = []
+    for number in range(1, count + 1):
+        lines = [" ".join(rng.choice(words) for _ in range(8)) for _ in range(50)]
+        cell = {"cell_type": "code", "metadata": {}, "outputs": [], "source": "\n".join(lines)}
+        cells.append((number, Cell.from_json(cell)))
+    return cells
+
+
+def test_diff_of_rewritten_gap_is_fast():
+    rng = random.Random(0)
+    old, new = rewritten_cells(rng, 50), rewritten_cells(rng, 50)
+
+    started = time.perf_counter()
+    entries = diff_cells(old, new)
+    elapsed = time.perf_counter() - started
+
+    # Similar-looking but unrelated cells; pairing them used to take minutes
+    assert len(entries) == 100
+    assert elapsed <= DIFF_GAP_SECONDS, f"diffing a 50 x 50 gap took {elapsed:.2f}s"
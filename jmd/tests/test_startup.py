@@ -0,0 +1,112 @@
+import os
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import jmd
+
+# --- Startup Budgets ---
+#
+# jmd is often run on one small notebook at a time (e.g. from an editor save
+# hook), where interpreter and import startup dominate. Budgets can be tuned
+# per CI box through the environment.
+
+# Cumulative time of `import jmd` reported by `python -X importtime`.
+IMPORT_BUDGET_MS = float(os.environ.get("JMD_IMPORT_BUDGET_MS", "30"))
+
+# Wall time of converting a 10-cell notebook with `python -m jmd`, on top of
+# the startup time of a bare interpreter.
+LATENCY_BUDGET_MS = float(os.environ.get("JMD_LATENCY_BUDGET_MS", "60"))
+
+# Modules of optional features, which a plain conversion must not import
+LAZY_MODULES = (
+    "argparse",
+    "bz2",
+    "gzip",
+    "lzma",
+    "hashlib",
+    "socket",
+    "shutil",
+    "sqlite3",
+    "html.parser",
+    "difflib",
+    "bisect",
+)
+
+JMD_DIR = Path(jmd.__file__).parent
+
+
+@pytest.fixture(scope="module")
+def python_env(tmp_path_factory):
+    """Environment with bytecode caching on (as on a user's machine), warmed up."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = str(tmp_path_factory.mktemp("pycache"))
+    subprocess.run([sys.executable, "-c", "import jmd"], cwd=JMD_DIR, env=env, check=True)
+    return env
+
+
+def best_wall_time(command, env, runs=5):
+    """Returns the fastest wall time, in milliseconds, of running `command`."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=JMD_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def import_times(env):
+    """Returns {module: cumulative import time in ms} for `import jmd`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import jmd"],
+        cwd=JMD_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def test_optional_modules_are_imported_lazily(python_env):
+    imported = import_times(python_env)
+    assert not [name for name in LAZY_MODULES if name in imported]
+
+
+def test_import_time_budget(python_env):
+    cost = min(import_times(python_env)["jmd"] for _ in range(3))
+    assert cost <= IMPORT_BUDGET_MS, f"import jmd took {cost:.1f} ms"
+
+
+def test_small_notebook_latency_budget(python_env, tmp_path):
+    cells = [
+        {
+            "cell_type": "code",
+            "execution_count": i,
+            "metadata": {},
+            "outputs": [{"output_type": "stream", "name": "stdout", "text": [f"{i}\n"]}],
+            "source": [f"print({i})"],
+        }
+        for i in range(10)
+    ]
+    notebook_path = tmp_path / "small.ipynb"
+    notebook_path.write_text(json.dumps({"cells": cells, "metadata": {}}), encoding="utf-8")
+
+    baseline = best_wall_time([sys.executable, "-c", "pass"], python_env)
+    latency = best_wall_time([sys.executable, "-m", "jmd", str(notebook_path)], python_env)
+
+    assert (tmp_path / "small.md").exists()
+    assert latency - baseline <= LATENCY_BUDGET_MS, (
+        f"converting 10 cells took {latency:.1f} ms ({baseline:.1f} ms interpreter startup)"
+    )